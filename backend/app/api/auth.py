@@ -9,7 +9,8 @@ user creation endpoint.
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app import crud, schemas
+from app import schemas
+from app.crud import CRUD
 from app.db import get_async_session
 
 router = APIRouter()
@@ -23,40 +24,50 @@ async def firebase_login(
     Handles user login/registration via Firebase ID token.
 
     1.  (TODO) Verify the Firebase ID token.
-    2.  Check if a user with the Firebase UID already exists.
-    3.  If not, check if the student_id is already taken.
+    2.  Look up the Firebase UID and the student_id together in one query.
+    3.  If the UID is unknown, reject a student_id that is already taken.
     4.  If the user is new, create them in the database.
     5.  (TODO) Return a JWT session token.
     """
     # In a real application, you would first verify the idToken with Firebase Admin SDK
     # to get the firebase_uid and other details. For now, we'll trust the input.
 
-    # Check if user already exists by firebase_uid
-    db_user = await crud.get_user_by_firebase_uid(db, firebase_uid=login_data.firebase_uid)
+    crud = CRUD(db)
+
+    # Check both the firebase_uid and the student_id in one round-trip
+    db_user, existing_student = await crud.lookup_firebase_or_student(
+        firebase_uid=login_data.firebase_uid, student_id=login_data.student_id
+    )
     if db_user:
         # TODO: Update last_login timestamp
         return db_user
 
     # If user does not exist, we are creating a new one.
     # Check if the student_id is already registered.
-    existing_student = await crud.get_user_by_student_id(
-        db, student_id=login_data.student_id
-    )
     if existing_student:
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
             detail="A user with this student ID already exists.",
         )
 
-    # Create the new user
-    try:
-        new_user = await crud.create_user(db=db, user=login_data)
+    # Create the new user; a concurrent login for the same UID or student_id
+    # makes the insert a no-op instead of an integrity error.
+    new_user = await crud.create_user_if_absent(
+        student_id=login_data.student_id,
+        full_name=login_data.full_name,
+        email=login_data.email,
+        firebase_uid=login_data.firebase_uid,
+    )
+    if new_user:
         return new_user
-    except Exception:
-        # This could catch database integrity errors, e.g., if a unique constraint is violated
-        # due to a race condition.
-        await db.rollback()
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Could not create user. An unexpected error occurred.",
-        )
\ No newline at end of file
+
+    # Lost the race: return the row that won it, or reject a taken student_id.
+    db_user, _ = await crud.lookup_firebase_or_student(
+        firebase_uid=login_data.firebase_uid, student_id=login_data.student_id
+    )
+    if db_user:
+        return db_user
+    raise HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail="A user with this student ID already exists.",
+    )
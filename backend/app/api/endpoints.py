@@ -1,46 +1,48 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File as FastAPIFile, Form
+from datetime import datetime, timezone
+from fastapi import APIRouter, Depends, HTTPException, Request, status, UploadFile, File as FastAPIFile, Form
 from pydantic import BaseModel
-from fastapi.responses import Response
+from fastapi.responses import Response, StreamingResponse
 from sqlmodel.ext.asyncio.session import AsyncSession
 from app.database import get_session
 from app.schemas import RegisterRequest, RegisterResponse, SubmissionUploadResponse, StudentLoginRequest, StudentLoginResponse, TpResponse
-from app.services.drive_service import drive_service as google_drive_service
-from app.services.student_list_service import student_list_service
-from app.services.data_service import DataService
 from app.services.registration_service import RegistrationService
 from app.crud import CRUD
-from app.sqlalchemy_models import User
-from sqlmodel import select
 
 router = APIRouter()
 
-# Initialize services (this will be done once at application startup in main.py)
-# For now, we define them here for dependency injection
-data_service = DataService(google_drive_service)
-registration_service = RegistrationService(google_drive_service, data_service)
-
 # Dependency to get CRUD operations instance
 async def get_crud(session: AsyncSession = Depends(get_session)) -> CRUD:
     return CRUD(session)
 
+# Services are built once in main.py's lifespan and shared through app.state
+def get_registration_service(request: Request) -> RegistrationService:
+    return request.app.state.registration_service
+
+# One timestamp per request, so every time-window check in it agrees
+def request_now() -> datetime:
+    return datetime.now(timezone.utc)
+
 @router.post("/register", response_model=RegisterResponse, status_code=status.HTTP_201_CREATED)
 async def register(
     request: RegisterRequest,
     session: AsyncSession = Depends(get_session),
-    crud: CRUD = Depends(get_crud)
+    crud: CRUD = Depends(get_crud),
+    registration_service: RegistrationService = Depends(get_registration_service),
+    now: datetime = Depends(request_now),
 ):
     """
     Registers a new student, assigns authors, prepares data, uploads to Drive,
     and records details in the database.
     """
     return await registration_service.register_student(
-        session, request.student_id, request.full_name, request.email, request.tp_id
+        session, request.student_id, request.full_name, request.email, request.tp_id, now
     )
 
 @router.post("/student/login", response_model=StudentLoginResponse, status_code=status.HTTP_200_OK)
 async def student_login(
     request: StudentLoginRequest,
     crud: CRUD = Depends(get_crud),
+    registration_service: RegistrationService = Depends(get_registration_service),
 ):
     """Logs in a student using an existing pre-generated ZIP in Drive."""
     return await registration_service.login_existing_student(
@@ -67,21 +69,15 @@ async def get_tp(tp_id: int, crud: CRUD = Depends(get_crud)):
 
 
 @router.get("/student/list", response_model=list[str])
-async def get_student_list(session: AsyncSession = Depends(get_session)):
+async def get_student_list(crud: CRUD = Depends(get_crud)):
     """Returns all valid student full names from students_list.csv, excluding those who already submitted."""
-    all_names = student_list_service.get_all_full_names()
-
-    stmt = select(User.full_name, User.has_submitted)
-    result = await session.execute(stmt)
-    rows = result.all()
-    submitted_names = {row[0] for row in rows if row[1]}
-
-    return [name for name in all_names if name not in submitted_names]
+    return await crud.get_unsubmitted_student_names()
 
 @router.get("/student/{student_id}/meta")
 async def get_student_meta(
     student_id: str,
-    crud: CRUD = Depends(get_crud)
+    crud: CRUD = Depends(get_crud),
+    registration_service: RegistrationService = Depends(get_registration_service),
 ):
     """
     Returns the student's meta.csv content.
@@ -97,11 +93,12 @@ async def get_student_meta(
 async def download_student_zip(
     student_id: str,
     crud: CRUD = Depends(get_crud),
+    registration_service: RegistrationService = Depends(get_registration_service),
 ):
-    """Downloads the student's pre-generated ZIP file from Drive."""
-    zip_bytes = await registration_service.get_student_zip_bytes(crud, student_id)
-    return Response(
-        content=zip_bytes,
+    """Streams the student's pre-generated ZIP file from Drive."""
+    zip_stream = await registration_service.stream_student_zip(crud, student_id)
+    return StreamingResponse(
+        zip_stream,
         media_type="application/zip",
         headers={
             "Content-Disposition": f"attachment; filename=student_{student_id}.zip"
@@ -115,7 +112,8 @@ async def upload_submission(
     file_type: str = Form(..., description="Type of file: 'ipynb' or 'embeddings'"),
     file: UploadFile = FastAPIFile(...),
     session: AsyncSession = Depends(get_session),
-    crud: CRUD = Depends(get_crud)
+    crud: CRUD = Depends(get_crud),
+    registration_service: RegistrationService = Depends(get_registration_service),
 ):
     """
     Uploads a student's submission (ipynb or embeddings file) to GitHub,
@@ -125,10 +123,8 @@ async def upload_submission(
     if not (file_type == "embeddings" or file_type.startswith("ipynb")):
         raise HTTPException(status_code=400, detail="Invalid file_type. Must be 'ipynb*' or 'embeddings'.")
     
-    file_content = await file.read()
-    
     return await registration_service.upload_submission(
-        session, student_id, file_content, file_type, file.filename, tp_id # Pass tp_id
+        session, student_id, file, file_type, tp_id # Pass tp_id
     )
 
 @router.post("/upload", response_model=SubmissionUploadResponse, status_code=status.HTTP_200_OK)
@@ -139,6 +135,7 @@ async def upload_legacy(
     file: UploadFile = FastAPIFile(...),
     session: AsyncSession = Depends(get_session),
     crud: CRUD = Depends(get_crud),
+    registration_service: RegistrationService = Depends(get_registration_service),
 ):
     """Compatibility endpoint for the frontend calling POST /api/upload.
 
@@ -148,10 +145,8 @@ async def upload_legacy(
     if not (file_type == "embeddings" or file_type.startswith("ipynb")):
         raise HTTPException(status_code=400, detail="Invalid file_type. Must be 'ipynb*' or 'embeddings'.")
 
-    file_content = await file.read()
-
     return await registration_service.upload_submission(
-        session, student_id, file_content, file_type, file.filename, tp_id # Pass tp_id
+        session, student_id, file, file_type, tp_id # Pass tp_id
     )
 
 class FirebaseLoginPayload(BaseModel):
@@ -161,15 +156,11 @@ class FirebaseLoginPayload(BaseModel):
     email: str
 
 
-@router.post("/auth/firebase_login")
+@router.post("/auth/firebase_login", response_model=FirebaseLoginPayload)
 async def firebase_login_stub(payload: FirebaseLoginPayload):
     """Development stub for Firebase login.
 
     Echoes back a user-like object so the frontend can store it.
     """
-    return {
-        "firebase_uid": payload.firebase_uid,
-        "student_id": payload.student_id,
-        "full_name": payload.full_name,
-        "email": payload.email,
-    }
+    # The payload is already validated; FastAPI serializes the model as-is.
+    return payload
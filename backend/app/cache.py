@@ -0,0 +1,84 @@
+"""
+Process-local caches.
+
+Cached values are immutable snapshots rather than ORM objects, so they are not
+tied to the session that loaded them and can be shared across requests.
+"""
+
+import datetime
+import hashlib
+from dataclasses import dataclass
+from typing import Optional
+from uuid import UUID
+
+from cachetools import TTLCache
+
+
+@dataclass(frozen=True)
+class TpSnapshot:
+    """Read-only copy of the `tps` columns used by the API and time-window checks."""
+
+    tp_id: int
+    name: str
+    description: Optional[str]
+    start_time: datetime.datetime
+    end_time: datetime.datetime
+    grace_minutes: int
+    max_access_hours: int
+    # Access window end, computed by the loading query: the earlier of
+    # start + max_access_hours and end_time + grace_minutes.
+    window_end: datetime.datetime
+
+    @classmethod
+    def from_orm_row(cls, tp, window_end: datetime.datetime) -> "TpSnapshot":
+        return cls(
+            tp_id=tp.tp_id,
+            name=tp.name,
+            description=tp.description,
+            start_time=tp.start_time,
+            end_time=tp.end_time,
+            grace_minutes=tp.grace_minutes,
+            max_access_hours=tp.max_access_hours,
+            window_end=window_end,
+        )
+
+
+@dataclass(frozen=True)
+class UserSnapshot:
+    """Read-only copy of the `users` columns needed to authorize a request."""
+
+    id: UUID
+    student_id: Optional[str]
+    full_name: str
+    email: Optional[str]
+    firebase_uid: Optional[str]
+    has_submitted: bool
+
+    @classmethod
+    def from_orm_row(cls, user) -> "UserSnapshot":
+        return cls(
+            id=user.id,
+            student_id=user.student_id,
+            full_name=user.full_name,
+            email=user.email,
+            firebase_uid=user.firebase_uid,
+            has_submitted=user.has_submitted,
+        )
+
+
+def token_key(token: str) -> str:
+    """Cache key for a bearer token, so raw tokens are never held as dict keys."""
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+# TPs only change when an admin edits them; a short TTL bounds staleness
+# across workers, and local mutations invalidate explicitly.
+tp_cache: TTLCache[int, TpSnapshot] = TTLCache(maxsize=256, ttl=60)
+
+# Verified token claims. The TTL is short enough to respect revocation, and
+# entries are still checked against their own `exp` before being served.
+firebase_token_cache: TTLCache[str, dict] = TTLCache(maxsize=10_000, ttl=60)
+jwt_payload_cache: TTLCache[str, dict] = TTLCache(maxsize=10_000, ttl=60)
+
+# Users looked up by authenticated requests; invalidated when has_submitted changes.
+user_cache: TTLCache[UUID, UserSnapshot] = TTLCache(maxsize=10_000, ttl=30)
@@ -1,3 +1,8 @@
+import orjson
+import base64
+from functools import lru_cache
+from pathlib import Path
+
 from pydantic import model_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -9,13 +14,36 @@ class Settings(BaseSettings):
     RAILWAY_TCP_PROXY_DOMAIN: str | None = None
     RAILWAY_TCP_PROXY_PORT: int | None = None
     POSTGRES_DB: str | None = None
+    # Set when DATABASE_URL points at a pgbouncer in transaction mode, which
+    # cannot keep asyncpg's per-connection prepared statements.
+    DB_BEHIND_PGBOUNCER: bool = False
+    DEBUG: bool = False
+    # Run Base.metadata.create_all at startup. The repo has no migration tool,
+    # so this stays on; workers take turns via an advisory lock (app.migrations).
+    AUTO_CREATE_SCHEMA: bool = True
 
-    GOOGLE_APPLICATION_CREDENTIALS: str
+    # Google credentials: accept either a file path or a base64 JSON string
+    GOOGLE_APPLICATION_CREDENTIALS: str | None = None
+    GOOGLE_APPLICATION_CREDENTIALS_B64: str | None = None
+    # Parsed service-account info, filled from GOOGLE_APPLICATION_CREDENTIALS_B64
+    GOOGLE_CREDS_INFO: dict | None = None
     DRIVE_ROOT_FOLDER_ID: str | None = None
     DISABLE_DRIVE_IN_DEV: bool = False
+    # Parsed metadata.csv is pickled here, keyed by the Drive md5Checksum.
+    # Defaults to backend/.cache so it is writable without root.
+    METADATA_CACHE_DIR: str = str(Path(__file__).resolve().parents[2] / ".cache" / "metadata")
+    # Drive lookups + downloads in flight at once while assembling one student's data
+    DRIVE_DOWNLOAD_CONCURRENCY: int = 8
+
+    # Auth settings
+    FIREBASE_CRED_PATH: str | None = None
+    JWT_SECRET_KEY: str | None = None
+    JWT_ALGORITHM: str = "HS256"
+    ACCESS_TOKEN_EXPIRE_MINUTES: int = 60  # 1 hour
 
     @model_validator(mode="after")
     def assemble_db_connection(self) -> "Settings":
+        # 1) Build DATABASE_URL if missing
         if self.DATABASE_URL is None:
             if all([
                 self.POSTGRES_USER,
@@ -28,9 +56,21 @@ class Settings(BaseSettings):
                     f"postgresql+asyncpg://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}@"
                     f"{self.RAILWAY_TCP_PROXY_DOMAIN}:{self.RAILWAY_TCP_PROXY_PORT}/{self.POSTGRES_DB}"
                 )
+
+        # 2) Decode the B64 service-account JSON in memory; DriveService passes it
+        # straight to Credentials.from_service_account_info, so it never hits disk.
+        if self.GOOGLE_CREDS_INFO is None and self.GOOGLE_APPLICATION_CREDENTIALS_B64:
+            try:
+                self.GOOGLE_CREDS_INFO = orjson.loads(base64.b64decode(self.GOOGLE_APPLICATION_CREDENTIALS_B64))
+            except Exception as e:
+                raise RuntimeError("Failed to decode GOOGLE_APPLICATION_CREDENTIALS_B64: " + str(e)) from e
+
         return self
 
     model_config = SettingsConfigDict(env_file=".env", extra="ignore")
 
 
-settings = Settings()
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Builds Settings (env parse + validators) once per process, on first use."""
+    return Settings()
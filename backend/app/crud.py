@@ -1,42 +1,143 @@
-from typing import List, Optional
+from typing import Iterable, List, Optional, Tuple
+from uuid import UUID, uuid4
 from sqlmodel.ext.asyncio.session import AsyncSession
 from sqlmodel import select
-from app.sqlalchemy_models import User, Tps, AssignedClass, File, Submission, HiddenTestId, ActivityLog
+from sqlalchemy import TIMESTAMP, Row, and_, bindparam, delete, func, insert, or_, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import IntegrityError
+from app.sqlalchemy_models import User, Tps, AssignedClass, File, Submission, HiddenTestId, ActivityLog, StudentsMaster
+from app.cache import TpSnapshot, UserSnapshot, tp_cache, user_cache
 import datetime
 
+# Built once: the per-request hot lookup reuses the same statement (and its
+# compiled-SQL cache entry) with only the bound student_id changing.
+_USER_BY_STUDENT_ID = select(User).where(User.student_id == bindparam("student_id"))
+
+# End of a TP's access window, evaluated by Postgres alongside the row:
+# LEAST(start + max_access_hours, end + grace_minutes). make_interval's
+# positional args are (years, months, weeks, days, hours, mins).
+_TP_WINDOW_END = func.least(
+    Tps.start_time + func.make_interval(0, 0, 0, 0, Tps.max_access_hours),
+    Tps.end_time + func.make_interval(0, 0, 0, 0, 0, Tps.grace_minutes),
+    type_=TIMESTAMP(timezone=True),
+).label("window_end")
+
+
 class CRUD:
     def __init__(self, session: AsyncSession):
         self.session = session
 
-    async def create_user(self, student_id: str, full_name: str, email: str) -> User:
-        user = User(student_id=student_id, full_name=full_name, email=email)
-        self.session.add(user)
+    # Writers use INSERT ... RETURNING so generated columns come back with the
+    # insert itself; no follow-up refresh SELECT is needed. The *_no_commit
+    # variants leave the transaction open so multi-step flows can commit once.
+
+    async def _insert_returning(self, model, **values):
+        result = await self.session.execute(insert(model).values(**values).returning(model))
+        return result.scalar_one()
+
+    async def create_user_no_commit(self, student_id: str, full_name: str, email: str, firebase_uid: Optional[str] = None) -> User:
+        return await self._insert_returning(User, student_id=student_id, full_name=full_name, email=email, firebase_uid=firebase_uid)
+
+    async def create_user(self, student_id: str, full_name: str, email: str, firebase_uid: Optional[str] = None) -> User:
+        user = await self.create_user_no_commit(student_id, full_name, email, firebase_uid)
+        await self.session.commit()
+        return user
+
+    async def create_user_if_absent(self, student_id: str, full_name: str, email: str, firebase_uid: str) -> Optional[User]:
+        """Inserts the user unless a row with the same firebase_uid or student_id exists.
+
+        Returns None when a conflicting row was already there (e.g. a concurrent login won the race).
+        """
+        # The conflict target names uq_users_firebase_uid's columns and predicate, so a
+        # database missing that unique index errors out instead of silently duplicating UIDs.
+        statement = (
+            pg_insert(User)
+            .values(student_id=student_id, full_name=full_name, email=email, firebase_uid=firebase_uid)
+            .on_conflict_do_nothing(index_elements=["firebase_uid"], index_where=User.firebase_uid.is_not(None))
+            .returning(User)
+        )
+        try:
+            result = await self.session.execute(statement)
+        except IntegrityError:
+            # student_id taken by a concurrent insert (users.student_id is unique)
+            await self.session.rollback()
+            return None
+        user = result.scalar_one_or_none()
         await self.session.commit()
-        await self.session.refresh(user)
         return user
 
+    async def get_user_by_id(self, user_id: UUID) -> Optional[UserSnapshot]:
+        snapshot = user_cache.get(user_id)
+        if snapshot:
+            return snapshot
+        user = await self.session.get(User, user_id)
+        if not user:
+            return None
+        snapshot = user_cache[user_id] = UserSnapshot.from_orm_row(user)
+        return snapshot
+
     async def get_user_by_student_id(self, student_id: str) -> Optional[User]:
-        statement = select(User).where(User.student_id == student_id)
-        result = await self.session.execute(statement)
+        result = await self.session.execute(_USER_BY_STUDENT_ID, {"student_id": student_id})
         return result.scalar_one_or_none()
 
-    async def get_tp_by_id(self, tp_id: int) -> Optional[Tps]:
-        statement = select(Tps).where(Tps.tp_id == tp_id)
-        result = await self.session.execute(statement)
-        return result.scalar_one_or_none()
+    async def get_registration_state(self, student_id: str, tp_id: int) -> Tuple[Optional[User], Optional[AssignedClass], Optional[str]]:
+        """(user, their assigned classes for the TP, their dataset zip's Drive ID) in one query.
+
+        Each part is None when missing; registration uses this to spot an idempotent re-register.
+        """
+        statement = (
+            select(User, AssignedClass, File.drive_file_id)
+            .outerjoin(AssignedClass, and_(AssignedClass.user_id == User.id, AssignedClass.tp_id == tp_id))
+            .outerjoin(File, and_(File.user_id == User.id, File.tp_id == tp_id, File.file_type == "dataset_zip"))
+            .where(User.student_id == student_id)
+            .limit(1)
+        )
+        row = (await self.session.execute(statement)).first()
+        if row is None:
+            return None, None, None
+        user, assigned, dataset_drive_id = row
+        return user, assigned, dataset_drive_id
+
+    async def lookup_firebase_or_student(self, firebase_uid: str, student_id: str) -> Tuple[Optional[Row], Optional[Row]]:
+        """Returns (row matching firebase_uid, row matching student_id) from a single query.
+
+        Only the columns the login flow needs are selected, so no User objects are built.
+        """
+        statement = (
+            select(User.id, User.firebase_uid, User.student_id, User.full_name, User.email)
+            .where(or_(User.firebase_uid == firebase_uid, User.student_id == student_id))
+            .limit(2)
+        )
+        rows = (await self.session.execute(statement)).all()
+        by_firebase_uid = next((row for row in rows if row.firebase_uid == firebase_uid), None)
+        by_student_id = next((row for row in rows if row.student_id == student_id), None)
+        return by_firebase_uid, by_student_id
+
+    async def get_tp_by_id(self, tp_id: int) -> Optional[TpSnapshot]:
+        snapshot = tp_cache.get(tp_id)
+        if snapshot:
+            return snapshot
+        result = await self.session.execute(select(Tps, _TP_WINDOW_END).where(Tps.tp_id == tp_id))
+        row = result.first()
+        if not row:
+            return None
+        tp, window_end = row
+        snapshot = tp_cache[tp_id] = TpSnapshot.from_orm_row(tp, window_end)
+        return snapshot
 
     async def create_tp(self, name: str, start_time: datetime.datetime, end_time: datetime.datetime, grace_minutes: int, max_access_hours: int) -> Tps:
-        tp = Tps(name=name, start_time=start_time, end_time=end_time, grace_minutes=grace_minutes, max_access_hours=max_access_hours)
-        self.session.add(tp)
+        tp = await self._insert_returning(Tps, name=name, start_time=start_time, end_time=end_time,
+                                          grace_minutes=grace_minutes, max_access_hours=max_access_hours)
         await self.session.commit()
-        await self.session.refresh(tp)
+        tp_cache.pop(tp.tp_id, None)
         return tp
 
+    async def add_assigned_classes_no_commit(self, tp_id: int, user_id: int, class_1: str, class_2: str, class_3: str) -> AssignedClass:
+        return await self._insert_returning(AssignedClass, tp_id=tp_id, user_id=user_id, class_1=class_1, class_2=class_2, class_3=class_3)
+
     async def add_assigned_classes(self, tp_id: int, user_id: int, class_1: str, class_2: str, class_3: str) -> AssignedClass:
-        assigned_classes = AssignedClass(tp_id=tp_id, user_id=user_id, class_1=class_1, class_2=class_2, class_3=class_3)
-        self.session.add(assigned_classes)
+        assigned_classes = await self.add_assigned_classes_no_commit(tp_id, user_id, class_1, class_2, class_3)
         await self.session.commit()
-        await self.session.refresh(assigned_classes)
         return assigned_classes
 
     async def get_assigned_classes(self, tp_id: int, user_id: int) -> Optional[AssignedClass]:
@@ -47,10 +148,11 @@ class CRUD:
         result = await self.session.execute(statement)
         return result.scalar_one_or_none()
 
-    async def add_file_record(self, user_id: int, drive_file_id: str, file_type: str, path: Optional[str] = None,
-                              original_filename: Optional[str] = None, stored_filename: Optional[str] = None,
-                              size_bytes: Optional[int] = None, tp_id: Optional[int] = None) -> File:
-        file_record = File(
+    async def add_file_record_no_commit(self, user_id: int, drive_file_id: str, file_type: str, path: Optional[str] = None,
+                                        original_filename: Optional[str] = None, stored_filename: Optional[str] = None,
+                                        size_bytes: Optional[int] = None, tp_id: Optional[int] = None) -> File:
+        return await self._insert_returning(
+            File,
             tp_id=tp_id,
             user_id=user_id,
             drive_file_id=drive_file_id,
@@ -60,11 +162,27 @@ class CRUD:
             file_type=file_type,
             size_bytes=size_bytes,
         )
-        self.session.add(file_record)
+
+    async def add_file_record(self, user_id: int, drive_file_id: str, file_type: str, path: Optional[str] = None,
+                              original_filename: Optional[str] = None, stored_filename: Optional[str] = None,
+                              size_bytes: Optional[int] = None, tp_id: Optional[int] = None) -> File:
+        file_record = await self.add_file_record_no_commit(
+            user_id, drive_file_id, file_type, path=path, original_filename=original_filename,
+            stored_filename=stored_filename, size_bytes=size_bytes, tp_id=tp_id,
+        )
         await self.session.commit()
-        await self.session.refresh(file_record)
         return file_record
 
+    async def get_latest_dataset_drive_id(self, user_id: UUID) -> Optional[str]:
+        """Drive ID of the user's most recently recorded dataset zip, across TPs."""
+        result = await self.session.execute(
+            select(File.drive_file_id)
+            .where(File.user_id == user_id, File.file_type == "dataset_zip")
+            .order_by(File.uploaded_at.desc())
+            .limit(1)
+        )
+        return result.scalar_one_or_none()
+
     async def get_dataset_file_for_user_tp(self, user_id: int, tp_id: int) -> Optional[File]:
         statement = select(File).where(
             File.user_id == user_id,
@@ -75,44 +193,126 @@ class CRUD:
         return result.scalar_one_or_none()
 
     async def add_submission_record(self, user_id: int, file_id: int, file_type: str, tp_id: Optional[int] = None) -> Submission:
-        submission = Submission(user_id=user_id, file_id=file_id, file_type=file_type, tp_id=tp_id)
-        self.session.add(submission)
-        # Update user's has_submitted flag only for embeddings submissions
-        user = await self.session.get(User, user_id)
-        if user and file_type.endswith("embeddings"):
-            user.has_submitted = True
-            self.session.add(user)
+        submission = await self._insert_returning(Submission, user_id=user_id, file_id=file_id, file_type=file_type, tp_id=tp_id)
+        # Update user's has_submitted flag only for embeddings submissions,
+        # directly in SQL so the User row never has to be loaded.
+        if file_type.endswith("embeddings"):
+            await self.session.execute(
+                update(User).where(User.id == user_id).values(has_submitted=True)
+            )
+            user_cache.pop(user_id, None)
         await self.session.commit()
-        await self.session.refresh(submission)
         return submission
 
+    async def add_hidden_test_ids_no_commit(self, tp_id: int, user_id: int, hidden_ids_data: List[dict]) -> List[HiddenTestId]:
+        if not hidden_ids_data:
+            return []
+        values = [
+            {
+                "tp_id": tp_id,
+                "user_id": user_id,
+                "text_id": item['text_id'],
+                "ground_truth": item['ground_truth'],
+            }
+            for item in hidden_ids_data
+        ]
+        # One multi-row INSERT ... RETURNING instead of an add + refresh per row
+        result = await self.session.execute(insert(HiddenTestId).returning(HiddenTestId), values)
+        return list(result.scalars().all())
+
     async def add_hidden_test_ids(self, tp_id: int, user_id: int, hidden_ids_data: List[dict]) -> List[HiddenTestId]:
-        hidden_test_objects = []
-        for item in hidden_ids_data:
-            hidden_test = HiddenTestId(
-                tp_id=tp_id,
-                user_id=user_id,
-                text_id=item['text_id'],
-                ground_truth=item['ground_truth']
-            )
-            self.session.add(hidden_test)
-            hidden_test_objects.append(hidden_test)
+        hidden_test_objects = await self.add_hidden_test_ids_no_commit(tp_id, user_id, hidden_ids_data)
         await self.session.commit()
-        for obj in hidden_test_objects:
-            await self.session.refresh(obj)
         return hidden_test_objects
 
+    async def add_activity_log_no_commit(self, user_id: Optional[int], activity_type: str, details: str | dict) -> ActivityLog:
+        return await self._insert_returning(
+            ActivityLog, user_id=user_id, action_key=activity_type,
+            details={"message": details} if isinstance(details, str) else details,
+        )
+
     async def add_activity_log(self, user_id: Optional[int], activity_type: str, details: str | dict) -> ActivityLog:
-        log = ActivityLog(user_id=user_id, action_key=activity_type, details={"message": details} if isinstance(details, str) else details)
-        self.session.add(log)
+        log = await self.add_activity_log_no_commit(user_id, activity_type, details)
         await self.session.commit()
-        await self.session.refresh(log)
         return log
     
+    async def persist_registration(self, user: Optional[User], student_id: str, full_name: str, email: str, tp_id: int,
+                                   classes: List[str], dataset_file: dict, hidden_ids_data: List[dict], log_details: str) -> UUID:
+        """Writes everything a registration produces in one statement, without committing.
+
+        The user (created when `user` is None, with a client-side id), the assigned classes,
+        the dataset file record, the hidden test ids and the activity log entry are data-modifying
+        CTEs of a single INSERT, so the whole write costs one round trip. Returns the user's id.
+        """
+        user_id = user.id if user else uuid4()
+        writes = []
+        if user is None:
+            writes.append(insert(User).values(id=user_id, student_id=student_id, full_name=full_name, email=email))
+        class_1, class_2, class_3 = classes
+        writes.append(insert(AssignedClass).values(tp_id=tp_id, user_id=user_id, class_1=class_1, class_2=class_2, class_3=class_3))
+        writes.append(insert(File).values(tp_id=tp_id, user_id=user_id, **dataset_file))
+        if hidden_ids_data:
+            writes.append(insert(HiddenTestId).values([
+                {"tp_id": tp_id, "user_id": user_id, "text_id": item['text_id'], "ground_truth": item['ground_truth']}
+                for item in hidden_ids_data
+            ]))
+        statement = insert(ActivityLog).values(user_id=user_id, action_key="registration", details={"message": log_details})
+        for i, write in enumerate(writes):
+            statement = statement.add_cte(write.cte(f"registration_write_{i}"))
+        await self.session.execute(statement)
+        return user_id
+
+    async def persist_submission(self, user_id: UUID, tp_id: int, submitted_file: dict, log_details: str,
+                                 mark_submitted: bool) -> None:
+        """Records an uploaded submission file, its activity log entry and (optionally) the
+        user's final-submission flag as CTEs of one INSERT, then commits."""
+        statement = (
+            insert(ActivityLog)
+            .values(user_id=user_id, action_key="submission", details={"message": log_details})
+            .add_cte(insert(File).values(tp_id=tp_id, user_id=user_id, **submitted_file).cte("submission_file"))
+        )
+        if mark_submitted:
+            statement = statement.add_cte(
+                update(User).where(User.id == user_id).values(has_submitted=True).cte("submission_user")
+            )
+        await self.session.execute(statement)
+        await self.session.commit()
+        if mark_submitted:
+            user_cache.pop(user_id, None)
+
     async def update_user_submission_status(self, user_id: int, has_submitted: bool):
         user = await self.session.get(User, user_id)
         if user:
             user.has_submitted = has_submitted
             self.session.add(user)
             await self.session.commit()
-            await self.session.refresh(user)
+            user_cache.pop(user_id, None)
+
+    async def sync_students_master(self, full_names: Iterable[str]) -> None:
+        """Makes students_master hold exactly the given roster, in the given order."""
+        # dict.fromkeys drops repeated names but keeps their first position
+        names = list(dict.fromkeys(full_names))
+        await self.session.execute(delete(StudentsMaster).where(StudentsMaster.full_name.not_in(names)))
+        if names:
+            statement = pg_insert(StudentsMaster).values(
+                [{"full_name": name, "position": position} for position, name in enumerate(names)]
+            )
+            await self.session.execute(
+                statement.on_conflict_do_update(
+                    index_elements=["full_name"], set_={"position": statement.excluded.position}
+                )
+            )
+        await self.session.commit()
+
+    async def get_unsubmitted_student_names(self) -> List[str]:
+        """Roster names minus students who already submitted, computed by Postgres in CSV order."""
+        submitted = select(User.full_name).where(
+            User.has_submitted, User.full_name == StudentsMaster.full_name
+        )
+        statement = (
+            select(StudentsMaster.full_name)
+            .where(~submitted.exists())
+            .order_by(StudentsMaster.position)
+        )
+        result = await self.session.execute(statement)
+        return list(result.scalars().all())
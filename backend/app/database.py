@@ -1,17 +1,53 @@
+from collections.abc import AsyncGenerator
+from uuid import uuid4
+
+import orjson
 from sqlmodel.ext.asyncio.session import AsyncSession
-from sqlalchemy.ext.asyncio import create_async_engine
-from sqlalchemy.orm import sessionmaker
-from app.core.config import settings
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from app.core.config import get_settings
+
+settings = get_settings()
+
+
+def orjson_dumps(value) -> str:
+    """JSON column serializer; orjson is much faster than stdlib json for the activity-log dicts."""
+    return orjson.dumps(value).decode()
+
 
 # The database URL is taken from the settings object
-engine = create_async_engine(settings.DATABASE_URL, echo=True, future=True)
+engine = create_async_engine(
+    settings.DATABASE_URL,
+    echo=settings.DEBUG,
+    future=True,
+    pool_size=20,
+    max_overflow=10,
+    pool_timeout=30,
+    pool_pre_ping=True,
+    pool_recycle=1800,
+    json_serializer=orjson_dumps,
+    json_deserializer=orjson.loads,
+    # pgbouncer (transaction mode) can't hold prepared statements across
+    # transactions: turn off both asyncpg's and SQLAlchemy's statement caches and
+    # give every statement a unique name, as SQLAlchemy's asyncpg docs prescribe.
+    # Otherwise keep a larger cache so repeated queries skip parse/plan.
+    connect_args=(
+        {
+            "statement_cache_size": 0,
+            "prepared_statement_cache_size": 0,
+            "prepared_statement_name_func": lambda: f"__asyncpg_{uuid4()}__",
+        }
+        if settings.DB_BEHIND_PGBOUNCER
+        else {"prepared_statement_cache_size": 512}
+    ),
+)
+
+# Built once at import; every request just checks a session out of it.
+AsyncSessionLocal = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
 
-async def get_session() -> AsyncSession:
+async def get_session() -> AsyncGenerator[AsyncSession, None]:
     """
     Dependency to get an async database session.
     """
-    async_session = sessionmaker(
-        engine, class_=AsyncSession, expire_on_commit=False
-    )
-    async with async_session() as session:
+    async with AsyncSessionLocal() as session:
         yield session
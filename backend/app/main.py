@@ -1,32 +1,40 @@
 # backend/app/main.py
 import os
+import asyncio
 import logging
+import logging.handlers
+import queue
 import datetime
-from pathlib import Path
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, Response, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+from sqlalchemy import text
 
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import sessionmaker
-
-from app.database import engine
-from app.sqlalchemy_models import Base
+from app.core.config import get_settings
+from app.database import AsyncSessionLocal, engine
+from app.migrations import apply_schema_upgrades
 from app.api.endpoints import router
-from app.services.drive_service import drive_service as google_drive_service
+from app.services.drive_service import get_drive_service
 from app.services.data_service import DataService
 from app.services.registration_service import RegistrationService
+from app.services import github_service
 from app.crud import CRUD
+from app.services.student_list_service import student_list_service
 
-# ----- service instances -----
-data_service_instance = DataService(google_drive_service)
-registration_service_instance = RegistrationService(google_drive_service, data_service_instance)
+settings = get_settings()
 
 # ----- logging tweaks -----
 logging.getLogger("sqlalchemy.engine").setLevel(logging.WARNING)  # reduce SQLAlchemy noise
 logger = logging.getLogger(__name__)
 
+# Handlers write to stderr from a background thread; callers on the event loop
+# only enqueue the record.
+_log_queue: queue.SimpleQueue = queue.SimpleQueue()
+logging.getLogger().addHandler(logging.handlers.QueueHandler(_log_queue))
+log_listener = logging.handlers.QueueListener(_log_queue, logging.StreamHandler(), respect_handler_level=True)
+
 # ----- CORS origins from env (comma-separated) -----
 # Default now points to your deployed frontend
 # Example: FRONTEND_ORIGINS="https://test-nlp-lol.vercel.app"
@@ -37,28 +45,18 @@ origins_env = os.getenv(
 CORS_ORIGINS = [o.strip() for o in origins_env.split(",") if o.strip()]
 
 # ----- lifespan: app startup/shutdown tasks -----
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    logger.info("Application startup...")
-
-    # Initialize DataService metadata (Drive)
-    from app.api import endpoints as api_endpoints
-    await data_service_instance.load_metadata()
-    await api_endpoints.data_service.load_metadata()
-    logger.info("Metadata loaded from Google Drive.")
-
-    # Create/check DB tables (dev / initial setup)
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
-    logger.info("Database tables created/checked.")
+async def init_db():
+    """Schema bootstrap, sample TP and roster sync; independent of the Drive metadata load."""
+    # Create any missing tables, then apply upgrades that create_all can't (new
+    # columns/indexes on existing tables)
+    await apply_schema_upgrades(engine, auto_create=settings.AUTO_CREATE_SCHEMA)
 
     # Insert a sample TP for testing if one doesn't exist
-    async_session_factory = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
-    async with async_session_factory() as session:
+    async with AsyncSessionLocal() as session:
         crud = CRUD(session)
         sample_tp = await crud.get_tp_by_id(1)
         if not sample_tp:
-            start_time = datetime.datetime.utcnow() - datetime.timedelta(minutes=30)
+            start_time = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(minutes=30)
             end_time = start_time + datetime.timedelta(days=1)
             await crud.create_tp(
                 name="NLP Test TP",
@@ -69,8 +67,53 @@ async def lifespan(app: FastAPI):
             )
             logger.info("Sample TP created in database.")
 
+        # Mirror students_list.csv into Postgres so /student/list is a single query
+        await crud.sync_students_master(student_list_service.get_all_full_names())
+        logger.info("students_master synced from students_list.csv.")
+
+
+async def warm_pool():
+    """Opens pool_size connections up front so the first requests don't pay for the handshakes."""
+    async def checkout():
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    await asyncio.gather(*(checkout() for _ in range(engine.pool.size())))
+    logger.info("Database connection pool warmed.")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    log_listener.start()
+    logger.info("Application startup...")
+
+    # Services are built here rather than at import, so importing the app never
+    # touches credentials; routes share these instances through app.state.
+    drive_service = await asyncio.to_thread(get_drive_service)
+    data_service = DataService(drive_service)
+    app.state.drive_service = drive_service
+    app.state.data_service = data_service
+    registration_service = RegistrationService(drive_service, data_service)
+    app.state.registration_service = registration_service
+
+    async def load_data():
+        await data_service.load_metadata()
+        logger.info("Metadata loaded from Google Drive.")
+        # Author folder IDs need the metadata's author list
+        try:
+            await registration_service.warmup()
+            logger.info("Drive folder IDs cached.")
+        except Exception as e:
+            logger.warning("Drive folder warmup failed; IDs will be resolved on first use: %s", e)
+
+    # Drive metadata and DB setup don't depend on each other; run them concurrently
+    await asyncio.gather(load_data(), init_db(), warm_pool())
+
     yield
+    await drive_service.aclose()
+    await github_service.aclose()
     logger.info("Application shutdown.")
+    log_listener.stop()
 
 # ----- FastAPI app -----
 app = FastAPI(
@@ -101,6 +144,17 @@ async def healthz():
 async def healthz_head():
     return Response(status_code=200)
 
+@app.get("/health", include_in_schema=False)
+async def health():
+    """Readiness check: verifies a pooled database connection still answers."""
+    try:
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+    except Exception as e:
+        logger.warning("Database health check failed: %s", e)
+        return JSONResponse({"status": "error", "database": "unreachable"}, status_code=status.HTTP_503_SERVICE_UNAVAILABLE)
+    return {"status": "ok", "database": "ok"}
+
 @app.head("/", include_in_schema=False)
 async def root_head():
     return Response(status_code=200)
@@ -109,10 +163,6 @@ async def root_head():
 async def root():
     return {"message": "Welcome to the NLP TP Platform API"}
 
-# ----- dependency overrides so endpoints can use the same instances ----- 
-app.dependency_overrides[DataService] = lambda: data_service_instance
-app.dependency_overrides[RegistrationService] = lambda: registration_service_instance
-
 # ----- run with uvicorn when executed directly (helps local dev) ----- 
 if __name__ == "__main__":
     import uvicorn
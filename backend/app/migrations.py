@@ -0,0 +1,84 @@
+"""
+Idempotent schema upgrades applied at every startup.
+
+create_all only creates missing tables and never touches existing ones, so
+tables, columns and indexes added after a database was first created are
+shipped here as plain DDL. Every statement must be safe to re-run
+(IF NOT EXISTS); append new ones to the end of SCHEMA_UPGRADES.
+"""
+
+import logging
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.sqlalchemy_models import Base
+
+logger = logging.getLogger(__name__)
+
+# Arbitrary key for pg_advisory_xact_lock, so concurrent workers apply the
+# upgrades one at a time instead of racing the same DDL.
+_UPGRADE_LOCK_KEY = 0x4E4C5001
+
+SCHEMA_UPGRADES: tuple[str, ...] = (
+    # Roster mirrored from students_list.csv; position keeps the CSV order.
+    """
+    CREATE TABLE IF NOT EXISTS students_master (
+        full_name TEXT PRIMARY KEY,
+        position INTEGER NOT NULL DEFAULT 0
+    )
+    """,
+    "ALTER TABLE students_master ADD COLUMN IF NOT EXISTS position INTEGER NOT NULL DEFAULT 0",
+    # Indexes declared in sqlalchemy_models __table_args__; create_all skips existing tables.
+    "CREATE INDEX IF NOT EXISTS ix_users_submitted ON users (full_name) WHERE has_submitted",
+    # create_user_if_absent's ON CONFLICT (firebase_uid) needs this unique index. It
+    # replaces the plain ix_users_firebase_uid (from the old index=True), which is only
+    # dropped once the unique one exists; with duplicate UIDs already stored, neither
+    # changes and startup logs an error instead of failing the build.
+    """
+    DO $$
+    BEGIN
+        IF to_regclass('uq_users_firebase_uid') IS NULL AND NOT EXISTS (
+            SELECT 1 FROM users WHERE firebase_uid IS NOT NULL
+            GROUP BY firebase_uid HAVING count(*) > 1
+        ) THEN
+            CREATE UNIQUE INDEX IF NOT EXISTS uq_users_firebase_uid
+            ON users (firebase_uid) WHERE firebase_uid IS NOT NULL;
+            DROP INDEX IF EXISTS ix_users_firebase_uid;
+        END IF;
+    END $$
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_files_user_tp_type ON files (user_id, tp_id, file_type)",
+)
+
+
+async def apply_schema_upgrades(engine: AsyncEngine, auto_create: bool = True) -> None:
+    """Creates missing tables (when auto_create) and runs SCHEMA_UPGRADES in one
+    transaction, serialized across workers.
+
+    Whether tables are missing is asked of the database itself, so pointing
+    DATABASE_URL at a fresh database always bootstraps it.
+    """
+    table_names = list(Base.metadata.tables)
+    async with engine.begin() as conn:
+        await conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": _UPGRADE_LOCK_KEY})
+        missing = await conn.scalar(
+            text("SELECT array_agg(name) FROM unnest(CAST(:names AS text[])) AS name WHERE to_regclass(name) IS NULL"),
+            {"names": table_names},
+        )
+        if missing:
+            if not auto_create:
+                raise RuntimeError(
+                    f"Database is missing tables {', '.join(missing)}; "
+                    "set AUTO_CREATE_SCHEMA=true or create the schema before starting."
+                )
+            await conn.run_sync(Base.metadata.create_all)
+            logger.info("Created missing database tables: %s", ", ".join(missing))
+        for statement in SCHEMA_UPGRADES:
+            await conn.execute(text(statement))
+        if await conn.scalar(text("SELECT to_regclass('uq_users_firebase_uid')::text")) is None:
+            logger.error(
+                "users has duplicate firebase_uid values, so uq_users_firebase_uid was not created; "
+                "first logins will fail until the duplicates are resolved."
+            )
+    logger.info("Schema upgrades applied.")
@@ -2,12 +2,17 @@ import datetime
 from typing import List, Optional
 from sqlmodel import Field, SQLModel, Relationship
 
+
+def utc_now() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
 class User(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     student_id: str = Field(unique=True, index=True)
     full_name: str
     email: str = Field(unique=True)
-    registration_time: datetime.datetime = Field(default_factory=datetime.datetime.utcnow)
+    registration_time: datetime.datetime = Field(default_factory=utc_now)
     has_submitted: bool = Field(default=False)
     
     assigned_classes: Optional["AssignedClasses"] = Relationship(back_populates="user")
@@ -39,7 +44,7 @@ class File(SQLModel, table=True):
     user_id: int = Field(foreign_key="user.id")
     drive_file_id: str
     file_type: str  # e.g., 'dataset_zip', 'submission_ipynb'
-    upload_time: datetime.datetime = Field(default_factory=datetime.datetime.utcnow)
+    upload_time: datetime.datetime = Field(default_factory=utc_now)
     
     user: Optional[User] = Relationship(back_populates="files")
     submission: Optional["Submission"] = Relationship(back_populates="file")
@@ -48,7 +53,7 @@ class Submission(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     user_id: int = Field(foreign_key="user.id")
     file_id: int = Field(foreign_key="file.id", unique=True)
-    submission_time: datetime.datetime = Field(default_factory=datetime.datetime.utcnow)
+    submission_time: datetime.datetime = Field(default_factory=utc_now)
 
     user: Optional[User] = Relationship(back_populates="submissions")
     file: Optional[File] = Relationship(back_populates="submission")
@@ -66,6 +71,6 @@ class ActivityLog(SQLModel, table=True):
     user_id: Optional[int] = Field(default=None, foreign_key="user.id")
     activity_type: str # e.g., 'registration', 'submission', 'error'
     details: str
-    timestamp: datetime.datetime = Field(default_factory=datetime.datetime.utcnow)
+    timestamp: datetime.datetime = Field(default_factory=utc_now)
 
     user: Optional[User] = Relationship(back_populates="activity_logs")
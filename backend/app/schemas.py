@@ -68,3 +68,21 @@ class TpResponse(BaseModel):
     end_time: str
     grace_minutes: int
     max_access_hours: int
+
+
+class UserCreate(BaseModel):
+    firebase_uid: str
+    student_id: str
+    full_name: str
+    email: EmailStr
+
+
+class User(BaseModel):
+    id: UUID
+    firebase_uid: Optional[str] = None
+    student_id: Optional[str] = None
+    full_name: str
+    email: Optional[str] = None
+
+    class Config:
+        from_attributes = True
@@ -5,24 +5,36 @@ Handles Firebase token verification and internal JWT creation/decoding.
 """
 
 from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from uuid import UUID
 
 import firebase_admin
 import jwt
+from jwt.algorithms import get_default_algorithms
 from firebase_admin import auth, credentials
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from pydantic import ValidationError
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app import crud, models, schemas
-from app.config import settings
+from app.cache import UserSnapshot, firebase_token_cache, jwt_payload_cache, token_key
+from app.core.config import get_settings
+from app.crud import CRUD
 from app.db import get_async_session
 
+settings = get_settings()
+
 # This scheme will be used in the API endpoints to extract the token from the
 # "Authorization: Bearer <token>" header.
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/firebase_login")
 
 
+@lru_cache(maxsize=1)
+def _jwt_key():
+    """JWT_SECRET_KEY prepared once for JWT_ALGORITHM (e.g. a parsed key object for RS*/ES*), reused for every encode/decode."""
+    return get_default_algorithms()[settings.JWT_ALGORITHM].prepare_key(settings.JWT_SECRET_KEY)
+
+
 def initialize_firebase():
     """
     Initializes the Firebase Admin SDK if it hasn't been already.
@@ -45,9 +57,17 @@ def initialize_firebase():
             # In production, you might `raise` here.
 
 
+def _unexpired(claims: dict | None) -> dict | None:
+    """Returns cached claims only while their own `exp` is still in the future."""
+    if claims and claims.get("exp", 0) > datetime.now(timezone.utc).timestamp():
+        return claims
+    return None
+
+
 def verify_firebase_token(id_token: str) -> dict:
     """
     Verifies a Firebase ID token and returns the decoded claims.
+    Verified claims are cached briefly, keyed by the token's hash.
 
     Raises:
         HTTPException: If the token is invalid, expired, or revoked.
@@ -57,8 +77,13 @@ def verify_firebase_token(id_token: str) -> dict:
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
             detail="Firebase Admin SDK not initialized. Check server configuration.",
         )
+    key = token_key(id_token)
+    cached = _unexpired(firebase_token_cache.get(key))
+    if cached:
+        return cached
     try:
         decoded_token = auth.verify_id_token(id_token)
+        firebase_token_cache[key] = decoded_token
         return decoded_token
     except auth.ExpiredIdTokenError:
         raise HTTPException(
@@ -85,14 +110,14 @@ def create_access_token(data: dict) -> str:
     )
     to_encode.update({"exp": expire})
     encoded_jwt = jwt.encode(
-        to_encode, settings.JWT_SECRET_KEY, algorithm=settings.JWT_ALGORITHM
+        to_encode, _jwt_key(), algorithm=settings.JWT_ALGORITHM
     )
     return encoded_jwt
 
 
 async def get_current_user(
     token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_session)
-) -> models.User:
+) -> UserSnapshot:
     """
     Dependency to get the current user from a backend-issued JWT.
     This is used to protect endpoints.
@@ -102,17 +127,23 @@ async def get_current_user(
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(
-            token, settings.JWT_SECRET_KEY, algorithms=[settings.JWT_ALGORITHM]
-        )
-        user_id: str | None = payload.get("sub")
-        if user_id is None:
+    key = token_key(token)
+    payload = _unexpired(jwt_payload_cache.get(key))
+    if payload is None:
+        try:
+            payload = jwt.decode(
+                token, _jwt_key(), algorithms=[settings.JWT_ALGORITHM]
+            )
+        except (jwt.PyJWTError, ValidationError):
             raise credentials_exception
-    except (jwt.PyJWTError, ValidationError):
+        jwt_payload_cache[key] = payload
+
+    try:
+        user_id = UUID(payload["sub"])
+    except (KeyError, TypeError, ValueError):
         raise credentials_exception
 
-    user = await crud.get_user_by_id(db, user_id=user_id)
+    user = await CRUD(db).get_user_by_id(user_id)
     if user is None:
         raise credentials_exception
     return user
\ No newline at end of file
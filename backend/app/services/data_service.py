@@ -1,21 +1,56 @@
-import csv
-import io
+import asyncio
+import logging
+import os
+import pickle
 import random
-from typing import List, Dict, Any
-from app.core.config import settings
+import sys
+import tempfile
+from itertools import chain
+import numpy as np
+import pandas as pd
+from typing import IO, List, Dict, Any, Iterable, Optional
+from app.core.config import get_settings
 from app.services.drive_service import GoogleDriveService
 
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# metadata.csv columns the app reads; anything else in the file is skipped at parse time
+METADATA_COLUMNS = ('Author', 'AuthorID', 'FileName', 'FilePath')
+
+# Bump when the pickled column layout changes so stale cache files are ignored
+METADATA_CACHE_VERSION = 2
+
+# metadata.csv stays in memory up to this size before the download spills to disk
+METADATA_SPOOL_MAX_BYTES = 8 * 1024 * 1024
+
+_rng = np.random.default_rng()
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
 class DataService:
     def __init__(self, drive_service: GoogleDriveService):
         self.drive_service = drive_service
-        self.metadata_list: List[Dict[str, Any]] = []
+        # metadata.csv held column-wise: row i is (author_col[i], author_id_col[i], file_name_col[i], file_path_col[i])
+        self.author_col: List[str] = []
+        self.author_id_col: np.ndarray = np.empty(0, dtype=np.int32)
+        self.file_name_col: List[str] = []
+        self.file_path_col: List[str] = []
         self.authors: List[str] = []
         self.author_ids: List[int] = []
+        # Row indices grouped by author, rebuilt whenever the columns change
+        self._by_author: Dict[str, List[int]] = {}
 
     async def load_metadata(self):
         """
-        Loads metadata.csv from Google Drive into a list of dicts.
+        Loads metadata.csv from Google Drive into parallel column lists.
         Ensures AuthorID is an integer and skips invalid rows.
+
+        The parsed result is pickled under METADATA_CACHE_DIR keyed by the file's
+        md5Checksum, so an unchanged file costs one metadata call instead of a
+        download and re-parse.
         """
         metadata_file_id = await self.drive_service.find_item_id_by_name(
             settings.DRIVE_ROOT_FOLDER_ID, "metadata.csv", is_folder=False
@@ -24,26 +59,98 @@ class DataService:
         if not metadata_file_id:
             raise FileNotFoundError(f"metadata.csv not found in Drive root folder {settings.DRIVE_ROOT_FOLDER_ID}")
 
-        metadata_bytes = await self.drive_service.download_file_by_id(metadata_file_id)
-        metadata_str = metadata_bytes.decode("utf-8")
+        file_meta = await self.drive_service.get_file_metadata(metadata_file_id, fields="md5Checksum")
+        cache_path = self._cache_path(file_meta.get("md5Checksum"))
 
-        reader = csv.DictReader(io.StringIO(metadata_str))
-        self.metadata_list = []
+        if cache_path and await asyncio.to_thread(self._load_cache, cache_path):
+            self._build_author_index()
+            logger.info("Loaded %d entries from cached metadata %s.", len(self.author_col), cache_path)
+            return
 
-        for row in reader:
-            try:
-                row['AuthorID'] = int(row['AuthorID'])
-            except (ValueError, KeyError):
-                # Skip rows with invalid or missing AuthorID
-                print(f"Skipping invalid row: {row}")
-                continue
-            self.metadata_list.append(row)
+        # Spool the download straight into the parser's input: no bytes copy, no decode copy
+        with tempfile.SpooledTemporaryFile(max_size=METADATA_SPOOL_MAX_BYTES) as sink:
+            await self.drive_service.download_file_by_id(metadata_file_id, sink=sink)
+            sink.seek(0)
+            self._parse_metadata(sink)
+        self._build_author_index()
 
-        self.authors = list({row['Author'] for row in self.metadata_list})
-        self.author_ids = list({row['AuthorID'] for row in self.metadata_list})
+        if cache_path:
+            await asyncio.to_thread(self._save_cache, cache_path)
 
-        print(f"Loaded {len(self.metadata_list)} valid entries from metadata.csv.")
-        print(f"Unique authors: {len(self.authors)}")
+        logger.info("Loaded %d valid entries from metadata.csv.", len(self.author_col))
+        logger.info("Unique authors: %d", len(self.authors))
+
+    def _parse_metadata(self, metadata_file: IO[bytes]):
+        # pandas' C parser, reading only the columns the app uses; it also handles quoted fields.
+        df = pd.read_csv(
+            metadata_file,
+            usecols=lambda col: col in METADATA_COLUMNS,
+            dtype={col: str for col in METADATA_COLUMNS if col != 'AuthorID'},
+        )
+        for col in METADATA_COLUMNS:
+            if col not in df.columns:
+                df[col] = None
+        author_ids = pd.to_numeric(df['AuthorID'], errors='coerce')
+        invalid = author_ids.isna()
+        for row in df[invalid].to_dict('records'):
+            # Skip rows with invalid or missing AuthorID
+            logger.warning("Skipping invalid row: %s", row)
+        df = df[~invalid]
+        author_ids = author_ids[~invalid].astype(int)
+
+        self.author_col = df['Author'].tolist()
+        self.author_id_col = author_ids.to_numpy(dtype=np.int32)
+        self.file_name_col = df['FileName'].tolist()
+        self.file_path_col = df['FilePath'].tolist()
+        # Vectorised de-dup, in first-appearance order so the result is deterministic
+        self.authors = df['Author'].unique().tolist()
+        self.author_ids = author_ids.unique().tolist()
+
+    def _build_author_index(self):
+        # Intern author names so every row shares one str per author and
+        # lookups against them compare by identity first.
+        self.author_col = [_intern(author) for author in self.author_col]
+        self.authors = [_intern(author) for author in self.authors]
+        self._by_author = {}
+        for i, author in enumerate(self.author_col):
+            self._by_author.setdefault(author, []).append(i)
+
+    @staticmethod
+    def _cache_path(md5: Optional[str]) -> Optional[str]:
+        if not md5:
+            return None
+        return os.path.join(settings.METADATA_CACHE_DIR, f"metadata-v{METADATA_CACHE_VERSION}-{md5}.pkl")
+
+    def _load_cache(self, cache_path: str) -> bool:
+        """Loads the pickled columns; any failure is treated as a cache miss."""
+        if not os.path.exists(cache_path):
+            return False
+        try:
+            with open(cache_path, "rb") as f:
+                columns = pickle.load(f)
+            (author_col, author_id_col, file_name_col, file_path_col, authors, author_ids) = columns
+        except Exception as e:
+            # Unreadable or written by incompatible library versions (e.g. a numpy
+            # upgrade can raise ModuleNotFoundError / AttributeError): just rebuild
+            logger.warning("Ignoring unusable metadata cache %s: %r", cache_path, e)
+            return False
+        self.author_col, self.author_id_col = author_col, author_id_col
+        self.file_name_col, self.file_path_col = file_name_col, file_path_col
+        self.authors, self.author_ids = authors, author_ids
+        return True
+
+    def _save_cache(self, cache_path: str):
+        """Writes the parsed metadata atomically; a failed write only costs the next startup a download."""
+        columns = (self.author_col, self.author_id_col, self.file_name_col, self.file_path_col,
+                   self.authors, self.author_ids)
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(cache_path), suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(columns, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            logger.warning("Could not write metadata cache %s: %s", cache_path, e)
 
     def get_unique_authors(self) -> List[str]:
         """Returns a list of all unique authors."""
@@ -53,25 +160,35 @@ class DataService:
         """Samples a specified number of unique authors randomly."""
         return random.sample(self.authors, min(num_authors, len(self.authors)))
 
-    def get_files_for_authors(self, authors: List[str]) -> List[Dict[str, Any]]:
-        """Returns a list of files for the given list of authors."""
-        return [row for row in self.metadata_list if row['Author'] in authors]
+    def get_files_for_authors(self, authors: Iterable[str]) -> List[int]:
+        """Returns the metadata row indices of the given authors' files, grouped by author."""
+        # dict.fromkeys de-duplicates in O(k) while keeping the caller's order
+        return list(chain.from_iterable(self._by_author.get(author, ()) for author in dict.fromkeys(authors)))
+
+    def get_file_names_by_author(self, authors: Iterable[str]) -> Dict[str, List[str]]:
+        """Maps each given author to its file names, straight from the prebuilt author index."""
+        file_name_col = self.file_name_col
+        return {
+            author: [file_name_col[row] for row in self._by_author.get(author, ())]
+            for author in dict.fromkeys(authors)
+        }
 
-    def select_hidden_test_ids(self, student_files_list: List[Dict[str, Any]], min_hidden: int = 1) -> List[Dict[str, Any]]:
-        """Select 10% of rows as hidden test items using the row index as text_id."""
-        num_files = len(student_files_list)
+    def select_hidden_test_ids(self, student_rows: List[int], min_hidden: int = 1) -> List[Dict[str, Any]]:
+        """Select 10% of the student's rows as hidden test items, using the position in student_rows as text_id."""
+        num_files = len(student_rows)
         num_hidden = max(min_hidden, int(num_files * 0.10))
 
         if num_files == 0:
             return []
 
-        hidden_indices = random.sample(range(num_files), min(num_hidden, num_files))
-        hidden_items = [student_files_list[i] for i in hidden_indices]
+        hidden_positions = _rng.choice(num_files, size=min(num_hidden, num_files), replace=False)
+        # Ground truth for all hidden rows in one fancy-index over the AuthorID column
+        hidden_author_ids = self.author_id_col[np.asarray(student_rows)[hidden_positions]]
 
         return [
             {
-                "text_id": int(idx),
-                "ground_truth": row['AuthorID']
+                "text_id": int(pos),
+                "ground_truth": int(author_id)
             }
-            for idx, row in zip(hidden_indices, hidden_items)
+            for pos, author_id in zip(hidden_positions, hidden_author_ids)
         ]
@@ -1,99 +1,396 @@
-import os
 import io
+import os
 import asyncio
-import json
-import base64
-import tempfile
-from typing import Optional
+import mimetypes
+import weakref
+from functools import lru_cache
+from typing import IO, AsyncIterator, Optional, Sequence
+import httpx
+import orjson
+from cachetools import TTLCache
+from google.auth.transport.requests import Request as GoogleAuthRequest
 from google.oauth2 import service_account
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseDownload, MediaFileUpload, MediaIoBaseUpload
-from app.core.config import settings
+from app.core.config import get_settings
+
+settings = get_settings()
+
+DRIVE_API_BASE_URL = "https://www.googleapis.com"
+FOLDER_MIME_TYPE = "application/vnd.google-apps.folder"
+# Upper bound on concurrent Drive calls issued by one bulk operation
+DRIVE_BATCH_LIMIT = 100
+# Resumable-upload chunks must be a multiple of 256 KiB (except the last)
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+# Names OR-ed into one files.list query by batch_find_items (keeps q well under URL limits)
+BATCH_FIND_NAMES = 50
+NAME_ID_CACHE_SIZE = 1024
+# The data/ and author folders are fixed for a whole TP; local creates/uploads overwrite entries directly
+NAME_ID_CACHE_TTL_SECONDS = 3600
+# Misses only absorb a burst of identical lookups: a file added in Drive (by an
+# admin or another worker) must show up within seconds, not after the hit TTL
+NAME_MISS_CACHE_TTL_SECONDS = 5
+_NOT_CACHED = object()
+# Drive query string literals escape both backslash and single quote
+_QUOTE_TABLE = str.maketrans({"'": "\\'", "\\": "\\\\"})
+_FOLDER_MIME_CLAUSE = f" and mimeType='{FOLDER_MIME_TYPE}'"
+
+
+def _names_query(parent_id: str, names: Sequence[str], is_folder: bool) -> str:
+    """files.list query matching non-trashed items directly under `parent_id` called any of `names`."""
+    name_clauses = " or ".join(f"name='{name.translate(_QUOTE_TABLE)}'" for name in names)
+    return (
+        f"'{parent_id}' in parents and ({name_clauses}) and trashed=false"
+        f"{_FOLDER_MIME_CLAUSE if is_folder else ''}"
+    )
+
+
+def _name_query(parent_id: str, name: str, is_folder: bool) -> str:
+    """files.list query matching a non-trashed item called `name` directly under `parent_id`."""
+    return (
+        f"'{parent_id}' in parents and name='{name.translate(_QUOTE_TABLE)}' and trashed=false"
+        f"{_FOLDER_MIME_CLAUSE if is_folder else ''}"
+    )
+
+
+def _key_lock(locks: weakref.WeakValueDictionary, key) -> asyncio.Lock:
+    """The lock shared by current users of `key`, created on first use."""
+    lock = locks.get(key)
+    if lock is None:
+        lock = locks[key] = asyncio.Lock()
+    return lock
+
+
+async def _iter_response(response: httpx.Response, chunksize: int) -> AsyncIterator[bytes]:
+    """Yields a streamed response's body, closing the response afterwards."""
+    try:
+        async for chunk in response.aiter_bytes(chunksize):
+            yield chunk
+    finally:
+        await response.aclose()
+
 
 class GoogleDriveService:
     def __init__(self):
         self.credentials = self._get_credentials()
-        self.service = self._build_drive_service()
+        # Every call goes straight to the Drive v3 REST API on one shared
+        # HTTP/2 client, so none of them occupies an executor thread.
+        # Google only gzips API responses when the User-Agent also contains "gzip"
+        self._http = httpx.AsyncClient(
+            base_url=DRIVE_API_BASE_URL,
+            http2=True,
+            timeout=30,
+            limits=httpx.Limits(max_connections=64, max_keepalive_connections=32),
+            headers={"Accept-Encoding": "gzip", "User-Agent": "nlp-backend (gzip)"},
+        )
+        self._token_lock = asyncio.Lock()
+        # (parent_id, name, is_folder) -> id for lookups, creates and uploads.
+        # Entries expire so items removed in Drive by other processes are picked
+        # up; local creates/uploads overwrite directly.
+        self._name_id_cache: TTLCache[tuple[str, str, bool], str] = TTLCache(
+            maxsize=NAME_ID_CACHE_SIZE, ttl=NAME_ID_CACHE_TTL_SECONDS
+        )
+        # Keys found absent, kept only briefly (see NAME_MISS_CACHE_TTL_SECONDS)
+        self._name_miss_cache: TTLCache[tuple[str, str, bool], bool] = TTLCache(
+            maxsize=NAME_ID_CACHE_SIZE, ttl=NAME_MISS_CACHE_TTL_SECONDS
+        )
+        # One lock per key, so concurrent misses for the same item share a single lookup
+        # Weak values: an entry lives only while some caller holds or waits on its lock
+        self._name_id_locks: weakref.WeakValueDictionary[tuple[str, str, bool], asyncio.Lock] = weakref.WeakValueDictionary()
+        self._ensure_folder_locks: weakref.WeakValueDictionary[tuple[str, str], asyncio.Lock] = weakref.WeakValueDictionary()
 
     def _get_credentials(self):
-        """Load credentials from base64 environment variable."""
-        credentials_b64 = os.getenv('GOOGLE_APPLICATION_CREDENTIALS_B64') or settings.GOOGLE_APPLICATION_CREDENTIALS_B64
-        if not credentials_b64:
-            raise ValueError("GOOGLE_APPLICATION_CREDENTIALS_B64 environment variable not set")
-
-        # Decode the Base64 string
-        credentials_json = base64.b64decode(credentials_b64).decode("utf-8")
-
-        # Write to a temporary JSON file
-        tmp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".json")
-        tmp_file.write(credentials_json.encode("utf-8"))
-        tmp_file.flush()
-        tmp_file.close()
-
-        # Use the temp file path to load credentials
-        return service_account.Credentials.from_service_account_file(
-            tmp_file.name,
-            scopes=['https://www.googleapis.com/auth/drive']
-        )
+        """Load credentials from the service-account info decoded by Settings, or a key file path."""
+        scopes = ['https://www.googleapis.com/auth/drive']
+        if settings.GOOGLE_CREDS_INFO:
+            return service_account.Credentials.from_service_account_info(settings.GOOGLE_CREDS_INFO, scopes=scopes)
+        if settings.GOOGLE_APPLICATION_CREDENTIALS:
+            return service_account.Credentials.from_service_account_file(settings.GOOGLE_APPLICATION_CREDENTIALS, scopes=scopes)
+        raise ValueError("Neither GOOGLE_APPLICATION_CREDENTIALS_B64 nor GOOGLE_APPLICATION_CREDENTIALS is set")
 
-    def _build_drive_service(self):
-        """Builds and returns an authorized Google Drive service client."""
-        return build('drive', 'v3', credentials=self.credentials, cache_discovery=False)
+    async def _auth_headers(self) -> dict:
+        """Bearer header for the REST calls; the access token is refreshed (once, under a lock) when it expires."""
+        if not self.credentials.valid:
+            async with self._token_lock:
+                if not self.credentials.valid:
+                    await asyncio.to_thread(self.credentials.refresh, GoogleAuthRequest())
+        return {"Authorization": f"Bearer {self.credentials.token}"}
 
-    async def _run_blocking_io(self, func, *args, **kwargs):
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(None, func, *args, **kwargs)
+    async def _get_json(self, path: str, params: dict) -> dict:
+        response = await self._http.get(path, params=params, headers=await self._auth_headers())
+        response.raise_for_status()
+        return orjson.loads(response.content)
+
+    async def aclose(self):
+        await self._http.aclose()
 
     async def find_item_id_by_name(self, parent_id: str | None, name: str, is_folder: bool = True) -> Optional[str]:
         if parent_id is None:
             raise ValueError("parent_id cannot be None when searching for a Drive item.")
-        mime_type = "application/vnd.google-apps.folder" if is_folder else ""
-        safe_name = name.replace("'", "\\'")
-        query = f"'{parent_id}' in parents and name='{safe_name}' and trashed=false"
-        if is_folder:
-            query += f" and mimeType='{mime_type}'"
-
-        results = await self._run_blocking_io(
-            self.service.files().list(q=query, spaces='drive', fields='files(id, name)').execute
-        )
-        files = results.get('files', [])
-        return files[0]['id'] if files else None
+        key = (parent_id, name, is_folder)
+        cached_id = self._cached_item_id(key)
+        if cached_id is not _NOT_CACHED:
+            return cached_id
+
+        async with _key_lock(self._name_id_locks, key):
+            cached_id = self._cached_item_id(key)
+            if cached_id is not _NOT_CACHED:
+                return cached_id
+            results = await self._get_json(
+                "/drive/v3/files", {"q": _name_query(parent_id, name, is_folder), "spaces": "drive", "fields": "files(id)", "pageSize": 1}
+            )
+            files = results.get('files', [])
+            item_id = files[0]['id'] if files else None
+            self._cache_item_id(key, item_id)
+            return item_id
+
+    async def batch_find_items(self, parent_id: str, names: Sequence[str], is_folder: bool = False) -> dict[str, Optional[str]]:
+        """find_item_id_by_name for many names under one parent.
+
+        Uncached names are resolved with one files.list per BATCH_FIND_NAMES names, all in
+        flight together, instead of one call per name. Returns name -> ID (None when absent).
+        """
+        item_ids: dict[str, Optional[str]] = {}
+        missing = []
+        for name in dict.fromkeys(names):
+            cached_id = self._cached_item_id((parent_id, name, is_folder))
+            if cached_id is _NOT_CACHED:
+                missing.append(name)
+            else:
+                item_ids[name] = cached_id
+
+        batches = [missing[start:start + BATCH_FIND_NAMES] for start in range(0, len(missing), BATCH_FIND_NAMES)]
+        pages = await self._gather_limited([
+            self._get_json("/drive/v3/files", {
+                "q": _names_query(parent_id, batch, is_folder),
+                "spaces": "drive",
+                "fields": "files(id, name)",
+                "pageSize": 1000,
+            })
+            for batch in batches
+        ])
+        found: dict[str, str] = {}
+        for page in pages:
+            for item in page.get('files', []):
+                found.setdefault(item['name'], item['id'])
+        for name in missing:
+            item_ids[name] = found.get(name)
+            self._cache_item_id((parent_id, name, is_folder), item_ids[name])
+        return item_ids
+
+    def _cached_item_id(self, key: tuple[str, str, bool]):
+        """Cached ID for key, None for a recent miss, or _NOT_CACHED."""
+        item_id = self._name_id_cache.get(key)
+        if item_id is not None:
+            return item_id
+        if key in self._name_miss_cache:
+            return None
+        return _NOT_CACHED
+
+    def _cache_item_id(self, key: tuple[str, str, bool], item_id: Optional[str]):
+        if item_id is None:
+            self._name_miss_cache[key] = True
+        else:
+            self._name_id_cache[key] = item_id
+            self._name_miss_cache.pop(key, None)
+
+    def _forget_item_id(self, item_id: str):
+        """Drops cached name -> ID entries pointing at an item Drive no longer has."""
+        for key in [key for key, cached_id in self._name_id_cache.items() if cached_id == item_id]:
+            self._name_id_cache.pop(key, None)
 
     async def ensure_folder(self, parent_id: str, folder_name: str) -> str:
-        folder_id = await self.find_item_id_by_name(parent_id, folder_name, is_folder=True)
+        folder_id = self._name_id_cache.get((parent_id, folder_name, True))
         if folder_id:
             return folder_id
-        file_metadata = {'name': folder_name, 'parents': [parent_id], 'mimeType': 'application/vnd.google-apps.folder'}
-        folder = await self._run_blocking_io(
-            self.service.files().create(body=file_metadata, fields='id').execute
+        # Concurrent callers for the same folder wait here rather than each creating a duplicate
+        async with _key_lock(self._ensure_folder_locks, (parent_id, folder_name)):
+            folder_id = await self.find_item_id_by_name(parent_id, folder_name, is_folder=True)
+            if folder_id:
+                return folder_id
+            return await self._create_folder(parent_id, folder_name)
+
+    async def ensure_path(self, root_id: str, parts: Sequence[str]) -> str:
+        """ensure_folder for each segment of a folder path under root_id; returns the last folder's ID.
+
+        Segments already resolved in this process cost no round trip.
+        """
+        folder_id = root_id
+        for part in parts:
+            folder_id = await self.ensure_folder(folder_id, part)
+        return folder_id
+
+    async def _create_folder(self, parent_id: str, folder_name: str) -> str:
+        file_metadata = {'name': folder_name, 'parents': [parent_id], 'mimeType': FOLDER_MIME_TYPE}
+        response = await self._http.post(
+            "/drive/v3/files", params={"fields": "id"}, json=file_metadata, headers=await self._auth_headers()
         )
-        return folder.get('id')
-
-    async def download_file_by_id(self, file_id: str) -> bytes:
-        request = self.service.files().get_media(fileId=file_id)
-        file_content = io.BytesIO()
-        downloader = MediaIoBaseDownload(file_content, request)
-        done = False
-        while not done:
-            status, done = await self._run_blocking_io(downloader.next_chunk)
+        response.raise_for_status()
+        folder_id = orjson.loads(response.content).get('id')
+        self._cache_item_id((parent_id, folder_name, True), folder_id)
+        return folder_id
+
+    @staticmethod
+    async def _gather_limited(coros: list) -> list:
+        """asyncio.gather, at most DRIVE_BATCH_LIMIT calls in flight (they share one HTTP/2 connection)."""
+        results = []
+        for start in range(0, len(coros), DRIVE_BATCH_LIMIT):
+            results.extend(await asyncio.gather(*coros[start:start + DRIVE_BATCH_LIMIT]))
+        return results
+
+    async def get_file_metadata(self, file_id: str, fields: str = "modifiedTime,md5Checksum,size") -> dict:
+        """Fetches only the requested metadata fields, without the file content."""
+        try:
+            return await self._get_json(f"/drive/v3/files/{file_id}", {"fields": fields})
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code == 404:
+                self._forget_item_id(file_id)
+            raise
+
+    async def download_file_by_id(self, file_id: str, sink: Optional[IO[bytes]] = None) -> Optional[bytes]:
+        """Downloads the file into `sink` if given (nothing is returned), else returns its bytes."""
+        file_content = sink if sink is not None else io.BytesIO()
+        async for chunk in self.stream_file_by_id(file_id):
+            file_content.write(chunk)
+        if sink is not None:
+            return None
         return file_content.getvalue()
 
+    async def download_range(self, file_id: str, start: int, end: int) -> bytes:
+        """Returns bytes start..end (inclusive) of the file via an HTTP Range request."""
+        response = await self._http.get(
+            f"/drive/v3/files/{file_id}",
+            params={"alt": "media"},
+            headers={**await self._auth_headers(), "Range": f"bytes={start}-{end}"},
+        )
+        if response.status_code == 404:
+            self._forget_item_id(file_id)
+        response.raise_for_status()
+        return response.content
+
+    async def stream_file_by_id(self, file_id: str, chunksize: int = 256 * 1024) -> AsyncIterator[bytes]:
+        """Yields the file's content chunk by chunk so callers never hold all of it."""
+        async with self._http.stream(
+            "GET", f"/drive/v3/files/{file_id}", params={"alt": "media"}, headers=await self._auth_headers()
+        ) as response:
+            if response.status_code == 404:
+                self._forget_item_id(file_id)
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes(chunksize):
+                yield chunk
+
+    async def open_file_stream(self, file_id: str, chunksize: int = 256 * 1024) -> AsyncIterator[bytes]:
+        """Starts the download and checks its status before returning a chunk iterator.
+
+        Unlike stream_file_by_id, errors (e.g. a 404 for a stale cached ID) raise here,
+        before a caller has sent anything; the iterator closes the response when done.
+        """
+        request = self._http.build_request(
+            "GET", f"/drive/v3/files/{file_id}", params={"alt": "media"}, headers=await self._auth_headers()
+        )
+        response = await self._http.send(request, stream=True)
+        if response.is_error:
+            await response.aclose()
+            if response.status_code == 404:
+                self._forget_item_id(file_id)
+            response.raise_for_status()
+        return _iter_response(response, chunksize)
+
+    async def _start_upload(self, file_metadata: dict, size: Optional[int], mime_type: str, headers: dict) -> str:
+        """Opens a resumable upload session for the metadata; returns the session URI.
+
+        `size` may be None when the total isn't known up front (streamed uploads).
+        """
+        session_headers = {**headers, "X-Upload-Content-Type": mime_type}
+        if size is not None:
+            session_headers["X-Upload-Content-Length"] = str(size)
+        session = await self._http.post(
+            "/upload/drive/v3/files",
+            params={"uploadType": "resumable", "fields": "id"},
+            json=file_metadata,
+            headers=session_headers,
+        )
+        session.raise_for_status()
+        return session.headers["Location"]
+
+    async def _upload(self, file_metadata: dict, content: bytes, mime_type: str) -> str:
+        """Resumable upload of an in-memory body in one PUT."""
+        headers = await self._auth_headers()
+        upload_url = await self._start_upload(file_metadata, len(content), mime_type, headers)
+        response = await self._http.put(upload_url, content=content, headers={**headers, "Content-Type": mime_type})
+        response.raise_for_status()
+        return orjson.loads(response.content).get('id')
+
+    async def _put_chunk(self, upload_url: str, chunk: bytes, start: int, total: Optional[int]) -> Optional[str]:
+        """Sends one Content-Range chunk of a resumable upload.
+
+        Returns the new file's ID once Drive has the whole body, or None while it
+        expects more (308 Resume Incomplete). `total` is None until the last chunk.
+        """
+        if chunk:
+            content_range = f"bytes {start}-{start + len(chunk) - 1}/{'*' if total is None else total}"
+        else:
+            content_range = f"bytes */{total}"
+        response = await self._http.put(
+            upload_url, content=chunk, headers={**await self._auth_headers(), "Content-Range": content_range}
+        )
+        if response.status_code == 308:
+            return None
+        response.raise_for_status()
+        return orjson.loads(response.content).get('id')
+
+    async def _upload_file_chunks(self, file_metadata: dict, file_path: str, mime_type: str) -> str:
+        """Resumable upload of a local file, one Content-Range PUT per UPLOAD_CHUNK_SIZE chunk.
+
+        Each chunk is read off the event loop, and only one chunk is held in memory at a time.
+        """
+        total = os.path.getsize(file_path)
+        headers = await self._auth_headers()
+        upload_url = await self._start_upload(file_metadata, total, mime_type, headers)
+        start = 0
+        with open(file_path, 'rb') as f:
+            while True:
+                chunk = await asyncio.to_thread(f.read, UPLOAD_CHUNK_SIZE)
+                file_id = await self._put_chunk(upload_url, chunk, start, total)
+                if file_id is not None or not chunk:
+                    return file_id
+                start += len(chunk)
+
+    async def upload_stream_to_folder(self, folder_id: str, chunks: AsyncIterator[bytes], filename: str,
+                                      mime_type: str = 'application/zip') -> str:
+        """Resumable upload of a body produced while it is being sent (total size unknown up front).
+
+        Whole UPLOAD_CHUNK_SIZE chunks go out as soon as they are buffered; the remainder is
+        sent with the final size once `chunks` is exhausted.
+        """
+        file_metadata = {'name': filename, 'parents': [folder_id]}
+        upload_url = await self._start_upload(file_metadata, None, mime_type, await self._auth_headers())
+        buffer = bytearray()
+        start = 0
+        async for data in chunks:
+            buffer += data
+            # Strictly greater: the final PUT must never be empty
+            while len(buffer) > UPLOAD_CHUNK_SIZE:
+                await self._put_chunk(upload_url, bytes(buffer[:UPLOAD_CHUNK_SIZE]), start, None)
+                del buffer[:UPLOAD_CHUNK_SIZE]
+                start += UPLOAD_CHUNK_SIZE
+        file_id = await self._put_chunk(upload_url, bytes(buffer), start, start + len(buffer))
+        self._cache_item_id((folder_id, filename, False), file_id)
+        return file_id
+
     async def upload_file_to_folder(self, folder_id: str, file_path: str, filename: str) -> str:
         file_metadata = {'name': filename, 'parents': [folder_id]}
-        media = MediaFileUpload(file_path, resumable=True)
-        file = await self._run_blocking_io(
-            self.service.files().create(body=file_metadata, media_body=media, fields='id').execute
-        )
-        return file.get('id')
+        mime_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        file_id = await self._upload_file_chunks(file_metadata, file_path, mime_type)
+        self._cache_item_id((folder_id, filename, False), file_id)
+        return file_id
 
     async def upload_bytes_as_file(self, folder_id: str, bytes_data: bytes, filename: str, mime_type: str = 'application/zip') -> str:
         file_metadata = {'name': filename, 'parents': [folder_id]}
-        media = MediaIoBaseUpload(io.BytesIO(bytes_data), mime_type, resumable=True)
-        file = await self._run_blocking_io(
-            self.service.files().create(body=file_metadata, media_body=media, fields='id').execute
-        )
-        return file.get('id')
+        file_id = await self._upload(file_metadata, bytes_data, mime_type)
+        self._cache_item_id((folder_id, filename, False), file_id)
+        return file_id
 
 
-# Singleton instance
-drive_service = GoogleDriveService()
+@lru_cache(maxsize=1)
+def get_drive_service() -> GoogleDriveService:
+    """Builds the process-wide Drive client on first use (loads the service-account credentials)."""
+    return GoogleDriveService()
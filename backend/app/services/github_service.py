@@ -1,18 +1,67 @@
 import os
 import base64
+import asyncio
+import logging
+from typing import BinaryIO
 import httpx
+import orjson
+from cachetools import TTLCache
 from dotenv import load_dotenv
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 GITHUB_PAT = os.getenv("GITHUB_PAT")
 GITHUB_REPO_OWNER = os.getenv("GITHUB_REPO_OWNER")
 GITHUB_REPO_NAME = os.getenv("GITHUB_REPO_NAME")
 GITHUB_BRANCH = os.getenv("GITHUB_BRANCH", "main") # Default to 'main' if not specified
 
+# One client for the process: uploads reuse pooled (HTTP/2) connections to
+# api.github.com instead of a fresh TLS handshake each. The token is sent per
+# request so the client isn't tied to a single PAT.
+_client = httpx.AsyncClient(
+    base_url="https://api.github.com",
+    http2=True,
+    timeout=httpx.Timeout(30.0),
+    limits=httpx.Limits(max_keepalive_connections=32, max_connections=128),
+    headers={"Accept": "application/vnd.github+json", "X-GitHub-Api-Version": "2022-11-28"},
+)
+
+SHA_CACHE_SIZE = 4096
+SHA_CACHE_TTL_SECONDS = 3600
+
+# Contents-API path -> blob SHA from our last successful PUT, so re-uploads of
+# the same file can go straight to an update. Bounded: an evicted or stale SHA
+# only costs the 409/422 -> lookup round trip below.
+_sha_cache: TTLCache[str, str] = TTLCache(maxsize=SHA_CACHE_SIZE, ttl=SHA_CACHE_TTL_SECONDS)
+
+# Must be a multiple of 3 so per-chunk base64 output concatenates cleanly
+B64_CHUNK_SIZE = 48 * 1024
+
+
+def _b64encode_stream(fileobj: BinaryIO) -> bytearray:
+    """Base64-encodes a binary file from its start, reading it in chunks."""
+    fileobj.seek(0)
+    encoded = bytearray()
+    while chunk := fileobj.read(B64_CHUNK_SIZE):
+        encoded += base64.b64encode(chunk)
+    return encoded
+
+
+def _contents_body(fields: dict, content_b64: bytes | bytearray) -> bytes:
+    """JSON body for the contents API with the base64 payload spliced in as-is.
+
+    The base64 alphabet needs no JSON escaping, so the encoded bytes are never
+    decoded to str or re-encoded by a JSON serializer.
+    """
+    head = orjson.dumps(fields)[:-1]  # drop the closing brace
+    return b"".join((head, b',"content":"', content_b64, b'"}'))
+
+
 async def upload_file_to_github(
     file_path_in_repo: str,
-    file_content: bytes,
+    file_content: bytes | BinaryIO,
     commit_message: str,
     owner: str = GITHUB_REPO_OWNER,
     repo: str = GITHUB_REPO_NAME,
@@ -24,7 +73,7 @@ async def upload_file_to_github(
 
     Args:
         file_path_in_repo (str): The full path to the file in the repository (e.g., "submissions/user1/file.ipynb").
-        file_content (bytes): The content of the file as bytes.
+        file_content (bytes | BinaryIO): The content of the file, as bytes or a seekable binary file.
         commit_message (str): The commit message for the upload.
         owner (str): The owner of the repository (user or organization).
         repo (str): The name of the repository.
@@ -35,48 +84,65 @@ async def upload_file_to_github(
         dict: A dictionary containing information about the uploaded file, or None if the upload fails.
     """
     if not all([owner, repo, branch, pat]):
-        print("Error: GitHub configuration missing. Ensure GITHUB_REPO_OWNER, GITHUB_REPO_NAME, GITHUB_BRANCH, and GITHUB_PAT are set in .env")
+        logger.error("GitHub configuration missing. Ensure GITHUB_REPO_OWNER, GITHUB_REPO_NAME, GITHUB_BRANCH, and GITHUB_PAT are set in .env")
         return None
 
-    url = f"https://api.github.com/repos/{owner}/{repo}/contents/{file_path_in_repo}"
-    headers = {
-        "Authorization": f"Bearer {pat}",
-        "Accept": "application/vnd.github+json",
-        "X-GitHub-Api-Version": "2022-11-28",
-    }
-
-    # Check if the file already exists to get its SHA for update
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(url, headers=headers)
-            sha = None
-            if response.status_code == 200:
-                sha = response.json().get("sha")
-            elif response.status_code != 404: # If not 200 (found) or 404 (not found), it's an error
-                print(f"Error checking file existence: {response.status_code} - {response.text}")
-                return None
-        except httpx.RequestError as e:
-            print(f"Network error checking file existence: {e}")
-            return None
+    headers = {"Authorization": f"Bearer {pat}"}
+    url = f"/repos/{owner}/{repo}/contents/{file_path_in_repo}"
 
-        content_encoded = base64.b64encode(file_content).decode("utf-8")
+    if isinstance(file_content, bytes):
+        content_encoded = base64.b64encode(file_content)
+    else:
+        content_encoded = await asyncio.to_thread(_b64encode_stream, file_content)
 
+    async def put(sha: str | None) -> httpx.Response:
         data = {
             "message": commit_message,
-            "content": content_encoded,
             "branch": branch,
         }
         if sha:
             data["sha"] = sha # Include SHA for updating an existing file
+        return await _client.put(
+            url, headers={**headers, "Content-Type": "application/json"}, content=_contents_body(data, content_encoded)
+        )
+
+    try:
+        # Most uploads create a new file, so PUT first (with the last known SHA, if any)
+        # and only look the SHA up when GitHub says the file exists or the SHA is stale.
+        response = await put(_sha_cache.get(url))
+        if response.status_code in (409, 422):
+            found, sha = await _get_file_sha(url, headers)
+            if not found:
+                return None
+            response = await put(sha)
+        response.raise_for_status() # Raise an exception for HTTP errors (4xx or 5xx)
+    except httpx.HTTPStatusError as e:
+        logger.error("HTTP error uploading file to GitHub: %s - %s", e.response.status_code, e.response.text)
+        return None
+    except httpx.RequestError as e:
+        logger.error("Network error uploading file to GitHub: %s", e)
+        return None
+
+    result = orjson.loads(response.content)
+    _sha_cache[url] = result["content"]["sha"]
+    return result
+
+
+async def _get_file_sha(url: str, headers: dict) -> tuple[bool, str | None]:
+    """Looks up an existing file's SHA. Returns (lookup succeeded, sha or None when the file doesn't exist)."""
+    try:
+        response = await _client.get(url, headers=headers)
+    except httpx.RequestError as e:
+        logger.error("Network error checking file existence: %s", e)
+        return False, None
+    if response.status_code == 200:
+        return True, orjson.loads(response.content).get("sha")
+    if response.status_code == 404:
+        return True, None
+    logger.error("Error checking file existence: %s - %s", response.status_code, response.text)
+    return False, None
 
-        try:
-            response = await client.put(url, headers=headers, json=data)
-            response.raise_for_status() # Raise an exception for HTTP errors (4xx or 5xx)
-            return response.json()
-        except httpx.HTTPStatusError as e:
-            print(f"HTTP error uploading file to GitHub: {e.response.status_code} - {e.response.text}")
-            return None
-        except httpx.RequestError as e:
-            print(f"Network error uploading file to GitHub: {e}")
-            return None
 
+async def aclose():
+    """Closes the shared client; called from the app's shutdown."""
+    await _client.aclose()
@@ -1,64 +1,121 @@
-import os
+import asyncio
+import csv
+import io
+import logging
+import struct
+import tempfile
 import zipfile
-from pathlib import Path
-import pandas as pd
-from typing import List, Dict, Any, Optional
-from datetime import datetime, timedelta, timezone
-from fastapi import HTTPException, status
+import zlib
+from functools import lru_cache
+import httpx
+import numpy as np
+from typing import AsyncIterator, List, Dict, Any, Optional
+from datetime import datetime, timezone
+from fastapi import HTTPException, UploadFile, status
 from sqlmodel.ext.asyncio.session import AsyncSession
-from sqlmodel import select
-from app.core.config import settings
+from app.core.config import get_settings
 from app.services.student_list_service import student_list_service
 from app.services.drive_service import GoogleDriveService
 from app.services.data_service import DataService
 from app.services import github_service # Import the new github_service
 from app.crud import CRUD
-from app.sqlalchemy_models import Tps, AssignedClass
+from app.cache import TpSnapshot
 import re
 
-class RegistrationService:
-    def __init__(self, drive_service: GoogleDriveService, data_service: DataService):
-        self.drive_service = drive_service
-        self.data_service = data_service
-        self.drive_data_folder_id: Optional[str] = None # Will be set on first use or app startup
-        
-    async def login_existing_student(
-        self,
-        session: AsyncSession,
-        student_id: str,
-        tp_id: int,
-    ) -> dict:
-        crud = CRUD(session)
+settings = get_settings()
+logger = logging.getLogger(__name__)
 
-        user = await crud.get_user_by_student_id(student_id)
-        if not user:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Student not registered"
-            )
+# Student zips stay in memory up to this size while meta.csv is read out of them
+ZIP_SPOOL_MAX_BYTES = 16 * 1024 * 1024
+# Zip entries written but not yet taken by the Drive upload; the zip writer waits beyond this
+ZIP_UPLOAD_QUEUE_SIZE = 4
 
-        # Validate TP timing
-        tp = await self._validate_tp_timing(crud, tp_id)
+_RE_NON_WORD = re.compile(r'[^\w\s-]')
+_RE_WS = re.compile(r'[-\s]+')
 
-        assigned = await crud.get_assigned_classes(tp_id=tp.tp_id, user_id=user.id)
-        dataset_file = await crud.get_dataset_file_for_user_tp(
-            user_id=user.id, tp_id=tp.tp_id
-        )
 
-        if not assigned or not dataset_file:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Student not fully registered for this TP"
-            )
+@lru_cache(maxsize=1024)
+def _sanitize_name(name: str) -> str:
+    return _RE_WS.sub('_', _RE_NON_WORD.sub('', name).strip())
+
+
+# End-of-central-directory record: fixed 22 bytes plus a comment of up to 64 KiB
+_ZIP_EOCD_SIGNATURE = b"PK\x05\x06"
+_ZIP_EOCD_MAX_SIZE = 22 + 0xFFFF
+_ZIP_CENTRAL_HEADER = struct.Struct("<4s4xHH8xI4xHHH8xI")
+_ZIP_LOCAL_HEADER = struct.Struct("<4s22xHH")
 
-        return {
-            "ok": True,
-            "student_id": user.student_id,
-            "full_name": user.full_name,
-            "assigned": [assigned.class_1, assigned.class_2, assigned.class_3],
-            "drive_zip_id": dataset_file.drive_file_id,
-        }
 
+def _find_zip_entry(central_directory: bytes, suffix: str) -> Optional[tuple[int, int, int, int]]:
+    """Scans a ZIP central directory for the first entry whose name ends with `suffix`.
+
+    Returns (flags, compression method, compressed size, local header offset), or None.
+    """
+    pos = 0
+    while pos + _ZIP_CENTRAL_HEADER.size <= len(central_directory):
+        (signature, flags, method, compressed_size, name_len, extra_len, comment_len,
+         header_offset) = _ZIP_CENTRAL_HEADER.unpack_from(central_directory, pos)
+        if signature != b"PK\x01\x02":
+            return None
+        name_start = pos + _ZIP_CENTRAL_HEADER.size
+        name = central_directory[name_start:name_start + name_len].decode("utf-8", "replace")
+        if name.endswith(suffix):
+            return flags, method, compressed_size, header_offset
+        pos = name_start + name_len + extra_len + comment_len
+    return None
+
+
+class _QueueWriter:
+    """Write-only, unseekable file object that collects zipfile's writes until take().
+
+    zipfile writes synchronously; the async caller then hands take() to a bounded
+    queue with `await queue.put(...)`, which is where backpressure comes from.
+    """
+
+    def __init__(self):
+        self._pending = bytearray()
+
+    def write(self, data) -> int:
+        self._pending += data
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self) -> bytes:
+        data = bytes(self._pending)
+        self._pending.clear()
+        return data
+
+
+async def _drain_queue(queue: asyncio.Queue) -> AsyncIterator[bytes]:
+    """Yields queued chunks until the None end marker."""
+    while (chunk := await queue.get()) is not None:
+        yield chunk
+
+
+async def _await_all_or_cancel(*tasks: asyncio.Task) -> None:
+    """Waits for every task. The first failure (or cancellation of the caller)
+    cancels and awaits the others, then propagates."""
+    try:
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_EXCEPTION)
+            for task in done:
+                task.result()
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+class RegistrationService:
+    def __init__(self, drive_service: GoogleDriveService, data_service: DataService):
+        self.drive_service = drive_service
+        self.data_service = data_service
+        self.drive_data_folder_id: Optional[str] = None # Will be set on first use or app startup
+        
     async def _get_drive_data_folder_id(self) -> str:
         if not self.drive_data_folder_id:
             if settings.DRIVE_ROOT_FOLDER_ID is None:
@@ -70,52 +127,56 @@ class RegistrationService:
                 raise HTTPException(status_code=500, detail="Google Drive 'data' folder not found.")
         return self.drive_data_folder_id
 
+    async def warmup(self):
+        """Resolves the 'data' and 'students' folders and every author folder once, filling the Drive ID cache."""
+        drive_data_folder_id = await self._get_drive_data_folder_id()
+        await asyncio.gather(
+            self.drive_service.ensure_folder(settings.DRIVE_ROOT_FOLDER_ID, "students"),
+            self.drive_service.batch_find_items(drive_data_folder_id, self.data_service.authors, is_folder=True),
+        )
+
     def _sanitize_name(self, name: str) -> str:
         """Sanitizes full_name for use in folder names."""
-        s = re.sub(r'[^\w\s-]', '', name).strip()
-        s = re.sub(r'[-\s]+', '_', s)
-        return s
+        return _sanitize_name(name)
 
-    async def _validate_tp_timing(self, crud: CRUD, tp_id: int) -> Tps:
+    async def _validate_tp_timing(self, crud: CRUD, tp_id: int, now: Optional[datetime] = None) -> TpSnapshot:
         tp = await crud.get_tp_by_id(tp_id)
         if not tp:
             raise HTTPException(status_code=404, detail="TP (Training Period) not found.")
 
-        current_time = datetime.now(timezone.utc)
-        allowed_start_time = tp.start_time
-        # Respect both max_access_hours and explicit end_time with grace period
-        max_access_end = tp.start_time + timedelta(hours=tp.max_access_hours)
-        hard_end = tp.end_time + timedelta(minutes=tp.grace_minutes)
-        allowed_end_time = min(max_access_end, hard_end)
-
-        if not (allowed_start_time <= current_time <= allowed_end_time):
+        # The window (max_access_hours and end_time + grace) is precomputed on the cached snapshot
+        current_time = now or datetime.now(timezone.utc)
+        if not (tp.start_time <= current_time <= tp.window_end):
             raise HTTPException(
                 status_code=400,
-                detail=f"Registration is only allowed between {allowed_start_time.isoformat()} and {allowed_end_time.isoformat()} UTC."
+                detail=f"Registration is only allowed between {tp.start_time.isoformat()} and {tp.window_end.isoformat()} UTC."
             )
         return tp
 
-    async def register_student(self, session: AsyncSession, student_id: str, full_name: str, email: str, tp_id: int) -> Dict[str, Any]:
+    async def register_student(self, session: AsyncSession, student_id: str, full_name: str, email: str, tp_id: int,
+                               now: Optional[datetime] = None) -> Dict[str, Any]:
         crud = CRUD(session)
 
-        # 1. Check for existing user with this student_id
-        existing_user = await crud.get_user_by_student_id(student_id)
+        # 1. Check for existing user with this student_id, fetching their assignment
+        # and dataset for this TP in the same query (for the idempotent path below)
+        existing_user, assigned, dataset_drive_id = await crud.get_registration_state(student_id, tp_id)
 
         # 2. Validate TP timing (always, even for existing users)
-        tp = await self._validate_tp_timing(crud, tp_id)
+        tp = await self._validate_tp_timing(crud, tp_id, now)
 
         # Fast path for local development: skip all Google Drive / data generation work.
         if getattr(settings, "DISABLE_DRIVE_IN_DEV", False):
             if existing_user:
                 user = existing_user
             else:
-                user = await crud.create_user(student_id=student_id, full_name=full_name, email=email)
+                user = await crud.create_user_no_commit(student_id=student_id, full_name=full_name, email=email)
 
-            await crud.add_activity_log(
+            await crud.add_activity_log_no_commit(
                 user_id=user.id,
                 activity_type="registration_dev",
                 details="Registration completed in dev mode without Drive integration.",
             )
+            await session.commit()
 
             return {
                 "ok": True,
@@ -132,110 +193,98 @@ class RegistrationService:
                     detail="This student ID is already registered with a different email.",
                 )
 
-            # Check if assignment and dataset already exist; if so, return them idempotently
-            assigned = await crud.get_assigned_classes(tp_id=tp.tp_id, user_id=existing_user.id)
-            dataset_file = await crud.get_dataset_file_for_user_tp(user_id=existing_user.id, tp_id=tp.tp_id)
-            if assigned and dataset_file:
+            # If assignment and dataset already exist, return them idempotently
+            if assigned and dataset_drive_id:
                 return {
                     "ok": True,
                     "student_id": existing_user.student_id,
                     "assigned": [assigned.class_1, assigned.class_2, assigned.class_3],
-                    "drive_zip_id": dataset_file.drive_file_id,
+                    "drive_zip_id": dataset_drive_id,
                 }
 
         # 3. Sample 4 random authors and prepare student data for new or not-yet-assigned user
         authors = self.data_service.sample_authors(4)
-        student_files_df = self.data_service.get_files_for_authors(authors).reset_index(drop=True)
-        
-        if student_files_df.empty:
+        student_rows = self.data_service.get_files_for_authors(authors)
+
+        if not student_rows:
             # This case should ideally be rare if metadata.csv is well-formed
             # For robustness, we could re-sample or raise a specific error
             raise HTTPException(status_code=500, detail="Sampled authors have no files associated. Please try again.")
 
-        hidden_test_data = self.data_service.select_hidden_test_ids(student_files_df)
-        hidden_file_ids = {item['text_id'] for item in hidden_test_data}
+        hidden_test_data = self.data_service.select_hidden_test_ids(student_rows)
+        hidden_file_ids = np.fromiter((item['text_id'] for item in hidden_test_data), dtype=np.int64, count=len(hidden_test_data))
 
-        # Create meta.csv content for the student: id, filepath, label_is_available
-        student_meta_df = student_files_df[['FilePath', 'AuthorID']].copy()
-        student_meta_df.insert(0, 'id', student_meta_df.index.astype(int))
-        student_meta_df['label_is_available'] = student_meta_df['id'].apply(
-            lambda x: 0 if x in hidden_file_ids else 1
-        )
-        # Ensure no ground truth labels are included in the student's meta.csv
-        student_meta_df = student_meta_df.drop(columns=['AuthorID']) 
+        # Create meta.csv content for the student: id, filepath, label_is_available.
+        # No ground truth labels are included in the student's meta.csv.
+        file_path_col = self.data_service.file_path_col
+        ids = np.arange(len(student_rows), dtype=np.int32)
+        labels = (~np.isin(ids, hidden_file_ids, assume_unique=True)).astype(np.int8)
+        # csv.writer straight into one buffer; a DataFrame round trip buys nothing for three columns
+        meta_csv = io.StringIO()
+        writer = csv.writer(meta_csv, lineterminator="\n")
+        writer.writerow(("id", "FilePath", "label_is_available"))
+        writer.writerows(zip(ids.tolist(), (file_path_col[row] for row in student_rows), labels.tolist()))
 
-        # 4. Create temporary directory, assemble data, and upload zip to Google Drive
-        temp_dir = tempfile.mkdtemp()
-        zip_file_path = None
-        try:
-            student_data_root = os.path.join(temp_dir, f"{student_id}_{self._sanitize_name(full_name)}")
-            os.makedirs(student_data_root, exist_ok=True)
-
-            # Write student's meta.csv
-            student_meta_csv_path = os.path.join(student_data_root, "meta.csv")
-            student_meta_df.to_csv(student_meta_csv_path, index=False)
+        student_folder_name = f"{student_id}_{self._sanitize_name(full_name)}"
 
+        # 4. Build the student's zip and stream it to Google Drive as it is written
+        try:
             # Locate the 'data' folder under the NLP_M1 root in the Shared Drive
             drive_data_folder_id = await self._get_drive_data_folder_id()
 
-            # For each author, create a folder and download their files
+            # Resolve the author folders, then each author's files, with one batched
+            # files.list per parent instead of one lookup per name.
+            drive_author_folder_ids = await self.drive_service.batch_find_items(
+                drive_data_folder_id, authors, is_folder=True
+            )
             for author_name in authors:
-                author_folder_path = os.path.join(student_data_root, author_name)
-                os.makedirs(author_folder_path, exist_ok=True)
-
-                # Files for this author in the student slice
-                author_files_df = student_files_df[student_files_df['Author'] == author_name]
-
-                # Find the Drive folder ID for this author within the 'data' folder
-                drive_author_folder_id = await self.drive_service.find_item_id_by_name(
-                    drive_data_folder_id, author_name, is_folder=True
-                )
-                if not drive_author_folder_id:
+                if not drive_author_folder_ids[author_name]:
                     raise HTTPException(status_code=500, detail=f"Google Drive author folder '{author_name}' not found.")
+            author_file_names = self.data_service.get_file_names_by_author(authors)
+            author_file_ids = dict(zip(authors, await asyncio.gather(*(
+                self.drive_service.batch_find_items(drive_author_folder_ids[author_name], file_names)
+                for author_name, file_names in author_file_names.items()
+            ))))
+
+            # Upload target: NLP_M1/students/<student_id>_<name>/data.zip
+            student_drive_folder_id = await self.drive_service.ensure_path(
+                settings.DRIVE_ROOT_FOLDER_ID, ["students", student_folder_name]
+            )
 
-                for _, row in author_files_df.iterrows():
-                    file_name = row['FileName']
-                    drive_file_id = await self.drive_service.find_item_id_by_name(
-                        drive_author_folder_id, file_name, is_folder=False
-                    )
+            files_to_zip = []
+            for author_name, file_names in author_file_names.items():
+                for file_name in file_names:
+                    drive_file_id = author_file_ids[author_name][file_name]
                     if not drive_file_id:
-                        print(f"Warning: File {file_name} not found in Drive for author {author_name}. Skipping.")
+                        logger.warning("File %s not found in Drive for author %s. Skipping.", file_name, author_name)
                         continue
-
-                    file_content = await self.drive_service.download_file_by_id(drive_file_id)
-                    with open(os.path.join(author_folder_path, file_name), 'wb') as f:
-                        f.write(file_content)
-
-            # Create the zip file
-            zip_filename = f"{student_id}_{self._sanitize_name(full_name)}_data.zip"
-            zip_base = os.path.join(tempfile.gettempdir(), zip_filename.replace('.zip', ''))
-            shutil.make_archive(zip_base, 'zip', student_data_root)
-            zip_file_path = f"{zip_base}.zip"
-
-            # Upload zip to Drive under NLP_M1/students/<student_id>_<name>/data.zip
-            students_folder_id = await self.drive_service.ensure_folder(
-                settings.DRIVE_ROOT_FOLDER_ID, "students"
-            )
-            student_drive_folder_id = await self.drive_service.ensure_folder(
-                students_folder_id, f"{student_id}_{self._sanitize_name(full_name)}"
-            )
-
-            drive_zip_id = await self.drive_service.upload_file_to_folder(
-                student_drive_folder_id, zip_file_path, "data.zip"
-            )
-
-            # 6. Persist to Postgres
-            if existing_user:
-                user = existing_user
-            else:
-                user = await crud.create_user(student_id=student_id, full_name=full_name, email=email)
+                    files_to_zip.append((drive_file_id, f"{author_name}/{file_name}"))
+
+            # The upload runs alongside the zip writer, sending each full chunk as soon
+            # as it is written, so the archive never touches disk. Either side failing
+            # cancels the other; Drive discards the unfinished upload session.
+            zip_chunks: asyncio.Queue = asyncio.Queue(maxsize=ZIP_UPLOAD_QUEUE_SIZE)
+            upload = asyncio.create_task(self.drive_service.upload_stream_to_folder(
+                student_drive_folder_id, _drain_queue(zip_chunks), "data.zip"
+            ))
+            writer = asyncio.create_task(self._write_student_zip(zip_chunks, meta_csv.getvalue(), files_to_zip))
+            await _await_all_or_cancel(writer, upload)
+            drive_zip_id = upload.result()
+
+            # 6. Persist to Postgres: one statement, then one commit.
             # Store first 3 classes in DB; the 4th is still included in the data package.
-            await crud.add_assigned_classes(tp_id=tp.tp_id, user_id=user.id, class_1=authors[0], class_2=authors[1], class_3=authors[2])
-            await crud.add_file_record(user_id=user.id, drive_file_id=drive_zip_id, file_type="dataset_zip", tp_id=tp.tp_id,
-                                       path=f"students/{student_id}_{self._sanitize_name(full_name)}/data.zip",
-                                       original_filename="data.zip", stored_filename="data.zip")
-            await crud.add_hidden_test_ids(tp_id=tp.tp_id, user_id=user.id, hidden_ids_data=hidden_test_data)
-            await crud.add_activity_log(user_id=user.id, activity_type="registration", details=f"Student {student_id} registered with authors: {', '.join(authors)}")
+            await crud.persist_registration(
+                existing_user, student_id=student_id, full_name=full_name, email=email, tp_id=tp.tp_id,
+                classes=authors[:3],
+                dataset_file={
+                    "drive_file_id": drive_zip_id, "file_type": "dataset_zip",
+                    "path": f"students/{student_folder_name}/data.zip",
+                    "original_filename": "data.zip", "stored_filename": "data.zip",
+                },
+                hidden_ids_data=hidden_test_data,
+                log_details=f"Student {student_id} registered with authors: {', '.join(authors)}",
+            )
+            await session.commit()
 
             return {
                 "ok": True,
@@ -244,26 +293,42 @@ class RegistrationService:
                 "drive_zip_id": drive_zip_id
             }
         except HTTPException as e:
+            await session.rollback()
             await crud.add_activity_log(user_id=None, activity_type="error", details=f"Registration failed for {student_id}: {e.detail}")
             raise e
         except Exception as e:
             # Log the unexpected error and potentially re-raise
-            print(f"An unexpected error occurred during registration for {student_id}: {e}")
+            logger.exception("An unexpected error occurred during registration for %s", student_id)
+            await session.rollback()
             await crud.add_activity_log(user_id=None, activity_type="error", details=f"Unexpected error during registration for {student_id}: {str(e)}")
             raise HTTPException(status_code=500, detail="An unexpected error occurred during registration.")
-        finally:
-            if os.path.exists(temp_dir):
-                try:
-                    shutil.rmtree(temp_dir)
-                except PermissionError:
-                    # On Windows, files can remain locked briefly; ignore cleanup failures.
-                    pass
-            if zip_file_path and os.path.exists(zip_file_path):
-                try:
-                    os.remove(zip_file_path)
-                except PermissionError:
-                    # Ignore if the OS still has a handle open; it will be cleaned up later.
-                    pass
+
+    async def _write_student_zip(self, zip_chunks: asyncio.Queue, meta_csv: str, files: List[tuple[str, str]]):
+        """Writes meta.csv plus each (drive_file_id, arcname) download into a zip, entry by
+        entry, onto `zip_chunks`, followed by the None end marker."""
+        sink = _QueueWriter()
+        write_lock = asyncio.Lock()
+        sem = asyncio.Semaphore(settings.DRIVE_DOWNLOAD_CONCURRENCY)
+
+        async def add_file(drive_file_id: str, arcname: str):
+            # The semaphore is held until the entry is queued, so a slow upload also
+            # stops new downloads instead of letting them pile up in memory.
+            async with sem:
+                file_content = await self.drive_service.download_file_by_id(drive_file_id)
+                # The lock keeps each entry's bytes contiguous and in queue order
+                async with write_lock:
+                    zf.writestr(arcname, file_content)
+                    await zip_chunks.put(sink.take())
+
+        # Entries are stored uncompressed: the zip is only a transport container,
+        # so DEFLATE would just burn CPU.
+        with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_STORED) as zf:
+            zf.writestr("meta.csv", meta_csv)
+            await zip_chunks.put(sink.take())
+            await _await_all_or_cancel(*(asyncio.create_task(add_file(*entry)) for entry in files))
+        # Closing the ZipFile wrote the central directory
+        await zip_chunks.put(sink.take())
+        await zip_chunks.put(None)
 
     async def login_existing_student(self, crud: CRUD, student_id: str, full_name: str) -> Dict[str, Any]:
         """Logs in a student using pre-generated ZIPs in Drive.
@@ -314,8 +379,12 @@ class RegistrationService:
             "has_submitted": user.has_submitted,
         }
 
-    async def get_student_zip_bytes(self, crud: CRUD, student_id: str) -> bytes:
-        """Fetches the pre-generated ZIP bytes for a student from Drive."""
+    async def stream_student_zip(self, crud: CRUD, student_id: str) -> AsyncIterator[bytes]:
+        """Resolves the student's pre-generated ZIP in Drive and returns a chunk iterator over it.
+
+        Lookups and the Drive request itself happen before the iterator is handed back,
+        so a missing student or file still surfaces as a 404 rather than a truncated download.
+        """
         user = await crud.get_user_by_student_id(student_id)
         if not user:
             raise HTTPException(status_code=404, detail="Student not found.")
@@ -339,7 +408,12 @@ class RegistrationService:
         if not drive_zip_id:
             raise HTTPException(status_code=404, detail="Student ZIP file not found in Drive.")
 
-        return await self.drive_service.download_file_by_id(drive_zip_id)
+        try:
+            return await self.drive_service.open_file_stream(drive_zip_id)
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code == 404:
+                raise HTTPException(status_code=404, detail="Student ZIP file not found in Drive.")
+            raise HTTPException(status_code=502, detail="Could not fetch the student ZIP from Drive.")
 
     async def get_student_meta_csv(self, crud: CRUD, student_id: str) -> Optional[bytes]:
         """
@@ -349,6 +423,49 @@ class RegistrationService:
         if not user:
             raise HTTPException(status_code=404, detail="Student not found.")
 
+        # Registration records the zip's Drive ID, so normally no folder walk is needed
+        data_zip_id = await crud.get_latest_dataset_drive_id(user.id)
+        if data_zip_id:
+            try:
+                return await self._read_meta_csv(data_zip_id)
+            except HTTPException as e:
+                if e.status_code != 404:
+                    raise
+                # The recorded file is gone from Drive; look the zip up by path instead
+        data_zip_id = await self._find_student_data_zip(student_id, user.full_name)
+        return await self._read_meta_csv(data_zip_id)
+
+    async def _read_meta_csv(self, data_zip_id: str) -> bytes:
+        """Reads meta.csv out of the student's data.zip; a zip missing from Drive is a 404."""
+        try:
+            meta_csv = await self._read_zip_entry_by_range(data_zip_id, 'meta.csv')
+            if meta_csv is not None:
+                return meta_csv
+
+            # Archives the range reader can't handle (ZIP64, encryption, other codecs):
+            # spool the whole zip (memory first, disk past ZIP_SPOOL_MAX_BYTES) and read meta.csv out of it
+            with tempfile.SpooledTemporaryFile(max_size=ZIP_SPOOL_MAX_BYTES) as zip_file:
+                await self.drive_service.download_file_by_id(data_zip_id, sink=zip_file)
+
+                with zipfile.ZipFile(zip_file, 'r') as z:
+                    # Find the actual path to meta.csv inside the zip
+                    meta_csv_name = None
+                    for name in z.namelist():
+                        if name.endswith('meta.csv'):
+                            meta_csv_name = name
+                            break
+
+                    if meta_csv_name:
+                        return z.read(meta_csv_name)
+                    else:
+                        raise HTTPException(status_code=500, detail="meta.csv not found inside student's data.zip.")
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code == 404:
+                raise HTTPException(status_code=404, detail="Student's data.zip not found.")
+            raise
+
+    async def _find_student_data_zip(self, student_id: str, full_name: str) -> str:
+        """Walks root -> students -> <student_id>_<name> -> data.zip in Drive for zips with no file record."""
         students_folder_id = await self.drive_service.find_item_id_by_name(
             settings.DRIVE_ROOT_FOLDER_ID, "students", is_folder=True
         )
@@ -356,7 +473,7 @@ class RegistrationService:
             raise HTTPException(status_code=500, detail="Google Drive 'students' folder not found.")
 
         student_drive_folder_id = await self.drive_service.find_item_id_by_name(
-            students_folder_id, f"{student_id}_{self._sanitize_name(user.full_name)}", is_folder=True
+            students_folder_id, f"{student_id}_{self._sanitize_name(full_name)}", is_folder=True
         )
         if not student_drive_folder_id:
             raise HTTPException(status_code=404, detail="Student's Drive folder not found.")
@@ -366,28 +483,56 @@ class RegistrationService:
         )
         if not data_zip_id:
             raise HTTPException(status_code=404, detail="Student's data.zip not found.")
+        return data_zip_id
 
-        zip_bytes = await self.drive_service.download_file_by_id(data_zip_id)
-        
-        # Extract meta.csv from the zip file in memory
-        with zipfile.ZipFile(io.BytesIO(zip_bytes), 'r') as z:
-            # Assuming meta.csv is at the root of the student's data folder within the zip
-            # e.g., student_id_fullname/meta.csv
-            
-            # Find the actual path to meta.csv inside the zip
-            meta_csv_name = None
-            for name in z.namelist():
-                if name.endswith('meta.csv'):
-                    meta_csv_name = name
-                    break
-            
-            if meta_csv_name:
-                return z.read(meta_csv_name)
-            else:
-                raise HTTPException(status_code=500, detail="meta.csv not found inside student's data.zip.")
+    async def _read_zip_entry_by_range(self, file_id: str, suffix: str) -> Optional[bytes]:
+        """Reads one entry out of a zip in Drive using Range requests only.
+
+        Fetches the tail (end-of-central-directory + central directory), then just the
+        entry's local header and data, instead of downloading the archive.
+        Returns None when the archive needs the full-download path.
+        """
+        size = int((await self.drive_service.get_file_metadata(file_id, fields="size"))["size"])
+        tail_start = max(0, size - _ZIP_EOCD_MAX_SIZE)
+        tail = await self.drive_service.download_range(file_id, tail_start, size - 1)
+        eocd = tail.rfind(_ZIP_EOCD_SIGNATURE)
+        if eocd < 0 or eocd + 22 > len(tail):
+            return None
+        cd_size, cd_offset = struct.unpack_from("<II", tail, eocd + 12)
+        if cd_offset == 0xFFFFFFFF or cd_offset + cd_size > size:
+            return None  # ZIP64
+        if cd_offset >= tail_start:
+            central_directory = tail[cd_offset - tail_start:cd_offset - tail_start + cd_size]
+        else:
+            central_directory = await self.drive_service.download_range(file_id, cd_offset, cd_offset + cd_size - 1)
+
+        entry = _find_zip_entry(central_directory, suffix)
+        if entry is None:
+            raise HTTPException(status_code=500, detail=f"{suffix} not found inside student's data.zip.")
+        flags, method, compressed_size, header_offset = entry
+        if flags & 0x1 or method not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+            return None
+
+        # Local header + name + extra are usually ~100 bytes; fetch generously in one go
+        # and top up only if the local extra field turns out to be longer.
+        guess_end = min(size, header_offset + _ZIP_LOCAL_HEADER.size + 1024 + compressed_size) - 1
+        chunk = await self.drive_service.download_range(file_id, header_offset, guess_end)
+        signature, name_len, extra_len = _ZIP_LOCAL_HEADER.unpack_from(chunk)
+        if signature != b"PK\x03\x04":
+            return None
+        data_start = _ZIP_LOCAL_HEADER.size + name_len + extra_len
+        data = chunk[data_start:data_start + compressed_size]
+        if len(data) < compressed_size:
+            data += await self.drive_service.download_range(
+                file_id, header_offset + data_start + len(data), header_offset + data_start + compressed_size - 1
+            )
+        if method == zipfile.ZIP_DEFLATED:
+            return zlib.decompress(data, -15)
+        return data
 
-    async def upload_submission(self, session: AsyncSession, student_id: str, file_content_bytes: bytes, file_type: str, original_filename: str, tp_id: int) -> Dict[str, Any]:
+    async def upload_submission(self, session: AsyncSession, student_id: str, file: UploadFile, file_type: str, tp_id: int) -> Dict[str, Any]:
         crud = CRUD(session)
+        original_filename = file.filename
 
         # 1. Validate user and submission status
         user = await crud.get_user_by_student_id(student_id)
@@ -430,7 +575,9 @@ class RegistrationService:
 
         github_upload_result = await github_service.upload_file_to_github(
             file_path_in_repo=github_file_path,
-            file_content=file_content_bytes,
+            # The spooled upload file is handed over as-is and encoded in chunks,
+            # so the raw payload is never copied into a bytes object here.
+            file_content=file.file,
             commit_message=commit_message,
         )
 
@@ -440,28 +587,23 @@ class RegistrationService:
                 detail="Failed to upload file to GitHub.",
             )
         
-        # 4. Save metadata to database. We store the GitHub URL in the existing drive_file_id column
-        # to avoid changing the current database schema.
-        await crud.add_file_record(
+        # 4. Save metadata to database in one statement. We store the GitHub URL in the existing
+        # drive_file_id column to avoid changing the current database schema.
+        # Embeddings are the final submission, so they also set has_submitted.
+        await crud.persist_submission(
             user_id=user.id,
-            drive_file_id=github_upload_result["content"]["html_url"],
-            file_type=file_type,
-            path=github_file_path,
-            original_filename=original_filename,
-            stored_filename=new_filename,
-            size_bytes=len(file_content_bytes),
-            tp_id=tp_id
+            tp_id=tp_id,
+            submitted_file={
+                "drive_file_id": github_upload_result["content"]["html_url"],
+                "file_type": file_type,
+                "path": github_file_path,
+                "original_filename": original_filename,
+                "stored_filename": new_filename,
+                "size_bytes": file.size,
+            },
+            log_details=f"Student {student_id} submitted {new_filename} (saved to GitHub)",
+            mark_submitted=file_type == "embeddings",
         )
-        
-        await crud.add_activity_log(
-            user_id=user.id,
-            activity_type="submission",
-            details=f"Student {student_id} submitted {new_filename} (saved to GitHub)",
-        )
-
-        # Mark final submission when embeddings are uploaded
-        if file_type == "embeddings":
-            await crud.update_user_submission_status(user.id, True)
 
         return {
             "ok": True,
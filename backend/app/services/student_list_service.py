@@ -1,6 +1,6 @@
 import csv
 from pathlib import Path
-from typing import Set
+from typing import FrozenSet
 
 
 class StudentListService:
@@ -11,13 +11,15 @@ class StudentListService:
     """
 
     def __init__(self) -> None:
-        self._full_names: Set[str] = set()
         self._all_names: list[str] = []
         self._load_students()
+        # Normalized once here, so a lookup normalizes only the incoming name
+        self._full_names: FrozenSet[str] = frozenset(map(self._normalize, self._all_names))
 
     def _normalize(self, name: str) -> str:
         """Normalize names for comparison: lowercase and collapse whitespace."""
-        return " ".join(name.split()).strip().lower()
+        # split() already drops leading/trailing whitespace
+        return " ".join(name.lower().split())
 
     def _load_students(self) -> None:
         # students_list.csv is in the backend project root
@@ -31,7 +33,6 @@ class StudentListService:
             for row in reader:
                 full_name = (row.get("Full_Name") or "").strip()
                 if full_name:
-                    self._full_names.add(self._normalize(full_name))
                     self._all_names.append(full_name)
 
     def is_valid_full_name(self, full_name: str) -> bool:
@@ -19,11 +19,13 @@ from sqlalchemy import (
     Column,
     Enum,
     ForeignKey,
+    Index,
     Integer,
     Numeric,
     String,
     Text,
     UniqueConstraint,
+    text,
 )
 from sqlalchemy.dialects.postgresql import JSONB, UUID as PG_UUID
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
@@ -63,11 +65,26 @@ class User(Base):
     surname: Mapped[str | None] = mapped_column(Text)
     email: Mapped[str | None] = mapped_column(Text)
     role: Mapped[UserRole] = mapped_column(Enum(UserRole, name="user_role"), nullable=False, server_default="student")
-    firebase_uid: Mapped[str | None] = mapped_column(Text, index=True)
+    firebase_uid: Mapped[str | None] = mapped_column(Text)
     created_at: Mapped[datetime] = mapped_column(TIMESTAMP(timezone=True), server_default=func.now())
     last_login: Mapped[datetime | None] = mapped_column(TIMESTAMP(timezone=True))
     has_submitted: Mapped[bool] = mapped_column(Boolean, nullable=False, server_default="false")
 
+    # Serves /student/list's "who already submitted" lookup from an index-only scan.
+    __table_args__ = (
+        Index("ix_users_submitted", "full_name", postgresql_where=text("has_submitted")),
+        Index("uq_users_firebase_uid", "firebase_uid", unique=True, postgresql_where=text("firebase_uid IS NOT NULL")),
+    )
+
+
+class StudentsMaster(Base):
+    """Authoritative roster, mirrored from students_list.csv at startup."""
+
+    __tablename__ = "students_master"
+    full_name: Mapped[str] = mapped_column(Text, primary_key=True)
+    # Row order in students_list.csv, so /student/list keeps the CSV order
+    position: Mapped[int] = mapped_column(Integer, nullable=False, server_default="0")
+
 
 class AssignedClass(Base):
     __tablename__ = "assigned_classes"
@@ -107,6 +124,9 @@ class File(Base):
     size_bytes: Mapped[int | None] = mapped_column(BigInteger)
     uploaded_at: Mapped[datetime] = mapped_column(TIMESTAMP(timezone=True), server_default=func.now())
 
+    # Covers get_dataset_file_for_user_tp's (user_id, tp_id, file_type) lookup.
+    __table_args__ = (Index("ix_files_user_tp_type", "user_id", "tp_id", "file_type"),)
+
 
 class Submission(Base):
     __tablename__ = "submissions"